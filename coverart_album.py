@@ -23,10 +23,16 @@ the base model for the plugin to work on top of.
 '''
 
 from datetime import datetime, date
+import collections
+import concurrent.futures
+import heapq
+import json
 import os
 import cgi
-import tempfile
 import gc
+import threading
+import time
+import weakref
 
 from gi.repository import RB
 from gi.repository import GObject
@@ -35,17 +41,21 @@ from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
-import cairo
 
 from coverart_browser_prefs import GSetting
-from coverart_utils import create_pixbuf_from_file_at_size
+from coverart_utils import ThumbnailCache
 from coverart_utils import SortedCollection
+from coverart_utils import Bitset
 from coverart_utils import idle_iterator
-from coverart_utils import NaturalString
+from coverart_utils import IDLE_TIME_BUDGET
+from coverart_utils import RateLimiter
+from coverart_utils import RequestQueue
+from coverart_utils import natural_sort_key
 import coverart_rb3compat as rb3compat
-from coverart_utils import uniquify_and_sort
 from coverart_utils import dumpstack
 from coverart_utils import check_lastfm
+from coverart_utils import download_pixbuf
+from coverart_utils import load_pixbuf
 import rb
 
 
@@ -57,198 +67,477 @@ ALBUM_LOAD_CHUNK = 50
 # default chunk of albums to process when loading covers
 COVER_LOAD_CHUNK = 5
 
+# size in pixels of the smallest level kept for the covers
+MIPMAP_MIN_SIZE = 32
+
+# maximum number of cover searches running at once
+COVER_SEARCH_CONCURRENCY = 4
+
+# cover searches started per second on each cover database
+COVER_SEARCH_RATE = 2.
+
+# seconds after which a cover search is given up
+COVER_SEARCH_TIMEOUT = 40
+
+# seconds a cover not found isn't searched again
+COVER_SEARCH_MISS_TTL = 30 * 24 * 60 * 60
+
+# number of visibility changes over which the views are detached from the
+# model while the changes are applied
+VISIBILITY_BATCH_THRESHOLD = 1000
+
 
 class Cover(GObject.Object):
     '''
     Cover of an Album. It may be initialized either by a file path to the image
-    to use or by a previously allocated pixbuf.
+    to use or by the levels previously created from it.
+    The image is decoded once at a power of two size and halved a few times,
+    so the cover can be resized in memory from the nearest larger level.
 
     :param size: `int` size in pixels of the side of the cover (asuming a
         square-shapped cover).
     :param image: `str` containing a path of an image from where to create
         the cover.
+    :param levels: `list` of `GdkPixbuf.Pixbuf` created from the image with
+        `create_levels`, if any.
     '''
     # signals
     __gsignals__ = {
         'resized': (GObject.SIGNAL_RUN_LAST, None, ())
     }
 
-    def __init__(self, size, image):
+    def __init__(self, size, image, levels=None):
         super(Cover, self).__init__()
 
         assert isinstance(image, str), "image should be a string"
 
         self.original = image
+        self.size = size
+
+        if levels:
+            self.set_levels(levels)
+        else:
+            self._create_pixbuf(size)
+
+    @staticmethod
+    def create_levels(image, size):
+        '''
+        Decodes an image at the power of two size that fits the given size and
+        creates the smaller levels halving it.
+
+        :param image: `str` path of the image.
+        :param size: `int` minimum size of the largest level.
+
+        :return: `list` of `GdkPixbuf.Pixbuf`, the largest first.
+        '''
+        level_size = Cover.level_size(size)
+        pixbuf = ThumbnailCache.get_default().get_pixbuf(image, level_size,
+                                                         level_size)
+        levels = [pixbuf]
+
+        while level_size // 2 >= MIPMAP_MIN_SIZE:
+            level_size //= 2
+            pixbuf = pixbuf.scale_simple(level_size, level_size,
+                                         GdkPixbuf.InterpType.BILINEAR)
+            levels.append(pixbuf)
+
+        return levels
+
+    @staticmethod
+    def level_size(size):
+        '''
+        Returns the size of the largest level of a cover of the given size.
+        '''
+        return max(MIPMAP_MIN_SIZE, 1 << (size - 1).bit_length())
+
+    def set_levels(self, levels):
+        '''
+        Replaces the levels of the cover, recreating its pixbuf from them.
+        '''
+        self._levels = levels
+        self.resident = True
+
+        self._scale()
+
+    @property
+    def sharp(self):
+        '''
+        Whether the cover's pixbuf was created from a larger level or it had
+        to be enlarged.
+        '''
+        return not self.resident or self._levels[0].get_width() >= self.size
+
+    @property
+    def nbytes(self):
+        '''
+        Memory used by the cover's pixbufs.
+        '''
+        if not self.resident:
+            return 0
+
+        pixbufs = list(self._levels)
+
+        if self.pixbuf not in pixbufs:
+            pixbufs.append(self.pixbuf)
 
-        self._create_pixbuf(size)
+        return sum(pixbuf.get_rowstride() * pixbuf.get_height()
+                   for pixbuf in pixbufs)
+
+    def _scale(self):
+        # use the smallest level that is at least as large as the cover
+        level = self._levels[0]
+
+        for smaller in self._levels[1:]:
+            if smaller.get_width() < self.size:
+                break
+
+            level = smaller
+
+        if level.get_width() == self.size:
+            self.pixbuf = level
+        else:
+            self.pixbuf = level.scale_simple(self.size, self.size,
+                                             GdkPixbuf.InterpType.BILINEAR)
 
     def resize(self, size):
         '''
-        Resizes the cover's pixbuf.
+        Resizes the cover's pixbuf from the nearest larger level. If the
+        levels are too small, the largest one is enlarged.
         '''
         if self.size != size:
-            self._create_pixbuf(size)
+            self.size = size
+
+            if not self.resident:
+                # it will be created at the new size when loaded
+                return
+
+            self._scale()
             self.emit('resized')
 
-    def _create_pixbuf(self, size):
-        self.pixbuf = create_pixbuf_from_file_at_size(
-            self.original, size, size)
+    def unload(self, placeholder):
+        '''
+        Releases the cover's pixbuf to save memory, showing a placeholder
+        until the cover is loaded again.
+
+        :param placeholder: `GdkPixbuf.Pixbuf` to show meanwhile.
+        '''
+        if self.resident:
+            self.pixbuf = placeholder
+            self._levels = None
+            self.resident = False
+            self.emit('resized')
+
+    def load(self):
+        '''
+        Recreates the pixbuf of a cover previously unloaded.
+        '''
+        if not self.resident:
+            self._create_pixbuf(self.size)
+            self.emit('resized')
 
+    def _create_pixbuf(self, size):
         self.size = size
+        self.set_levels(self.create_levels(self.original, size))
 
 
-class Shadow(Cover):
-    SIZE = 120.
-    WIDTH = 11
+class TrackRecord(object):
+    '''
+    Compact snapshot of the information the browser uses from a Rhythmbox's
+    database entry. It's filled in a single pass when the track is loaded and
+    afterwards only the fields affected by an entry change are read again.
 
-    def __init__(self, size, image):
-        super(Shadow, self).__init__(size, image)
+    :param entry: `RB.RhythmDBEntry` to take the snapshot from.
+    '''
+    __slots__ = ('title', 'artist', 'album', 'album_artist', 'genre', 'year',
+                 'rating', 'duration', 'location', 'composer', 'track_number',
+                 'disc_number', 'album_sort', 'album_artist_sort',
+                 'is_saveable')
 
-        self._calculate_sizes(size)
+    # fields that aren't read directly from a single property
+    derived_fields = ('album_sort', 'album_artist_sort', 'is_saveable')
 
-    def resize(self, size):
-        super(Shadow, self).resize(size)
+    # field -> (property, entry getter) and property -> affected fields,
+    # filled the first time a record is created
+    _field_props = None
+    _prop_fields = None
 
-        self._calculate_sizes(size)
+    def __init__(self, entry):
+        if not TrackRecord._field_props:
+            TrackRecord._init_fields()
 
-    def _calculate_sizes(self, size):
-        self.width = int(size / self.SIZE * self.WIDTH)
-        self.cover_size = self.size - self.width * 2
+        for field, (prop_type, getter) in self._field_props.items():
+            setattr(self, field, getattr(entry, getter)(prop_type))
 
+        for field in self.derived_fields:
+            setattr(self, field, self._read(entry, field))
 
-class ShadowedCover(Cover):
-    def __init__(self, shadow, image):
-        super(ShadowedCover, self).__init__(shadow.cover_size, image)
+    def __eq__(self, other):
+        return self.dump() == other.dump()
 
-        self._shadow = shadow
+    def matches(self, entry):
+        '''
+        Returns whether the record is up to date with the entry. The fields
+        are compared one by one, stopping at the first one that differs.
 
-        self._add_shadow()
+        :param entry: `RB.RhythmDBEntry` the record was taken from.
+        '''
+        for field in self.__slots__:
+            if self._read(entry, field) != getattr(self, field):
+                return False
 
-    def resize(self, size):
-        if self.size != self._shadow.cover_size:
-            self._create_pixbuf(self._shadow.cover_size)
-            self._add_shadow()
+        return True
 
-            self.emit('resized')
+    def dump(self):
+        '''
+        Returns a list with the values of the record, which can be stored and
+        given back to `restore`.
+        '''
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def restore(cls, values):
+        '''
+        Creates a record from the values returned by `dump`, without reading
+        them from the database.
+        '''
+        if not cls._field_props:
+            cls._init_fields()
+
+        record = cls.__new__(cls)
+
+        for field, value in zip(cls.__slots__, values):
+            setattr(record, field, value)
+
+        return record
+
+    @classmethod
+    def prop_types(cls):
+        '''
+        Returns all the database properties the record depends on.
+        '''
+        if not cls._prop_fields:
+            cls._init_fields()
+
+        return list(cls._prop_fields)
+
+    @classmethod
+    def _init_fields(cls):
+        prop = RB.RhythmDBPropType
+
+        cls._field_props = {
+            'title': (prop.TITLE, 'get_string'),
+            'artist': (prop.ARTIST, 'get_string'),
+            'album': (prop.ALBUM, 'get_string'),
+            'album_artist': (prop.ALBUM_ARTIST, 'get_string'),
+            'genre': (prop.GENRE, 'get_string'),
+            'year': (prop.DATE, 'get_ulong'),
+            'rating': (prop.RATING, 'get_double'),
+            'duration': (prop.DURATION, 'get_ulong'),
+            'location': (prop.LOCATION, 'get_string'),
+            'composer': (prop.COMPOSER, 'get_string'),
+            'track_number': (prop.TRACK_NUMBER, 'get_ulong'),
+            'disc_number': (prop.DISC_NUMBER, 'get_ulong')}
+
+        cls._prop_fields = {
+            prop.ALBUM_SORTNAME: ['album_sort'],
+            prop.ALBUM_ARTIST_SORTNAME: ['album_artist_sort']}
+
+        for field, (prop_type, getter) in cls._field_props.items():
+            cls._prop_fields.setdefault(prop_type, []).append(field)
+
+        cls._prop_fields[prop.ALBUM].append('album_sort')
+        cls._prop_fields[prop.ARTIST].append('album_artist_sort')
+        cls._prop_fields[prop.ALBUM_ARTIST].append('album_artist_sort')
+
+    def _read(self, entry, field):
+        prop = RB.RhythmDBPropType
+
+        if field == 'album_sort':
+            return entry.get_string(prop.ALBUM_SORTNAME_FOLDED) or \
+                   entry.get_string(prop.ALBUM_FOLDED)
+        elif field == 'album_artist_sort':
+            return entry.get_string(prop.ALBUM_ARTIST_SORTNAME_FOLDED) or \
+                   entry.get_string(prop.ALBUM_ARTIST_FOLDED) or \
+                   entry.get_string(prop.ARTIST_FOLDED)
+        elif field == 'is_saveable':
+            return entry.get_entry_type().props.save_to_disk
 
-    def _add_shadow(self):
-        pix = self._shadow.pixbuf
+        prop_type, getter = self._field_props[field]
 
-        surface = cairo.ImageSurface(
-            cairo.FORMAT_ARGB32, pix.get_width(), pix.get_height())
-        context = cairo.Context(surface)
+        return getattr(entry, getter)(prop_type)
 
-        # draw shadow
-        Gdk.cairo_set_source_pixbuf(context, pix, 0, 0)
-        context.paint()
+    def refresh(self, entry, prop_types):
+        '''
+        Reads again the fields affected by the given properties and returns
+        the set of fields whose value changed.
+
+        :param entry: `RB.RhythmDBEntry` the record was taken from.
+        :param prop_types: iterable of changed `RB.RhythmDBPropType`.
+        '''
+        changed = set()
 
-        # draw cover
-        Gdk.cairo_set_source_pixbuf(context, self.pixbuf, self._shadow.width,
-                                    self._shadow.width)
-        context.paint()
+        for prop_type in prop_types:
+            for field in self._prop_fields.get(prop_type, ()):
+                value = self._read(entry, field)
 
-        self.pixbuf = Gdk.pixbuf_get_from_surface(surface, 0, 0,
-                                                  self._shadow.size, self._shadow.size)
+                if value != getattr(self, field):
+                    setattr(self, field, value)
+                    changed.add(field)
 
+        return changed
 
-class Track(GObject.Object):
+
+class Track(object):
     '''
     A music track. Provides methods to access to most of the tracks data from
-    Rhythmbox's database.
+    Rhythmbox's database. The data is read from a `TrackRecord` snapshot, so
+    the track must be refreshed when its entry changes.
+    It's only a thin view over the record: instead of signals, the album that
+    holds the track (its `owner`) is notified directly through `modified` and
+    `deleted`.
 
     :param entry: `RB.RhythmbDBEntry` rhythmbox's database entry for the track.
+        It can be None if a record is given, in which case the entry is
+        looked up by location the first time it's needed.
     :param db: `RB.RhythmbDB` instance. It's needed to update the track's
         values.
+    :param record: `TrackRecord` with the track's data, if it's already known.
+    :param sort_keys: `tuple` with the album and album artist sort keys, if
+        they are already known.
     '''
-    # signals
-    __gsignals__ = {
-        'modified': (GObject.SIGNAL_RUN_LAST, None, ()),
-        'deleted': (GObject.SIGNAL_RUN_LAST, None, ())
-    }
-
-    __hash__ = GObject.__hash__
+    __slots__ = ('_entry', '_db', '_record', '_album_sort',
+                 '_album_artist_sort', 'owner')
 
-    def __init__(self, entry, db=None):
-        super(Track, self).__init__()
+    __hash__ = object.__hash__
 
-        self.entry = entry
+    def __init__(self, entry, db=None, record=None, sort_keys=None):
+        self.owner = None
+        self._entry = entry
         self._db = db
+        self._record = record if record else TrackRecord(entry)
+        self._album_sort, self._album_artist_sort = \
+            sort_keys if sort_keys else (None, None)
 
     def __eq__(self, other):
-        return rb.entry_equal(self.entry, other.entry)
+        return self.location == other.location
+
+    @property
+    def entry(self):
+        if self._entry is None:
+            self._entry = self._db.entry_lookup_by_location(self.location)
+
+        return self._entry
+
+    @entry.setter
+    def entry(self, entry):
+        self._entry = entry
+
+    @property
+    def record(self):
+        return self._record
 
     @property
     def title(self):
-        return self.entry.get_string(RB.RhythmDBPropType.TITLE)
+        return self._record.title
 
     @property
     def artist(self):
-        return self.entry.get_string(RB.RhythmDBPropType.ARTIST)
+        return self._record.artist
 
     @property
     def album(self):
-        return self.entry.get_string(RB.RhythmDBPropType.ALBUM)
+        return self._record.album
 
     @property
     def album_artist(self):
-        return self.entry.get_string(RB.RhythmDBPropType.ALBUM_ARTIST)
+        return self._record.album_artist
 
     @property
     def genre(self):
-        return self.entry.get_string(RB.RhythmDBPropType.GENRE)
+        return self._record.genre
 
     @property
     def year(self):
-        return self.entry.get_ulong(RB.RhythmDBPropType.DATE)
+        return self._record.year
 
     @property
     def rating(self):
-        return self.entry.get_double(RB.RhythmDBPropType.RATING)
+        return self._record.rating
 
     @rating.setter
     def rating(self, new_rating):
         self._db.entry_set(self.entry, RB.RhythmDBPropType.RATING, new_rating)
+        self._record.rating = new_rating
 
     @property
     def duration(self):
-        return self.entry.get_ulong(RB.RhythmDBPropType.DURATION)
+        return self._record.duration
 
     @property
     def location(self):
-        return self.entry.get_string(RB.RhythmDBPropType.LOCATION)
+        return self._record.location
 
     @property
     def composer(self):
-        return self.entry.get_string(RB.RhythmDBPropType.COMPOSER)
+        return self._record.composer
 
     @property
     def track_number(self):
-        return self.entry.get_ulong(RB.RhythmDBPropType.TRACK_NUMBER)
+        return self._record.track_number
 
     @property
     def disc_number(self):
-        return self.entry.get_ulong(RB.RhythmDBPropType.DISC_NUMBER)
+        return self._record.disc_number
 
     @property
     def album_artist_sort(self):
-        sort = self.entry.get_string(
-            RB.RhythmDBPropType.ALBUM_ARTIST_SORTNAME_FOLDED) or \
-               self.entry.get_string(RB.RhythmDBPropType.ALBUM_ARTIST_FOLDED) or \
-               self.entry.get_string(RB.RhythmDBPropType.ARTIST_FOLDED)
+        if self._album_artist_sort is None:
+            self._album_artist_sort = natural_sort_key(
+                self._record.album_artist_sort)
 
-        return NaturalString(sort)
+        return self._album_artist_sort
 
     @property
     def album_sort(self):
-        sort = self.entry.get_string(
-            RB.RhythmDBPropType.ALBUM_SORTNAME_FOLDED) or \
-               self.entry.get_string(RB.RhythmDBPropType.ALBUM_FOLDED)
+        if self._album_sort is None:
+            self._album_sort = natural_sort_key(self._record.album_sort)
 
-        return NaturalString(sort)
+        return self._album_sort
 
     @property
     def is_saveable(self):
-        return self.entry.get_entry_type().props.save_to_disk
+        return self._record.is_saveable
+
+    def refresh(self, prop_types):
+        '''
+        Updates the track's snapshot with the changes of its entry and returns
+        the set of fields that changed.
+
+        :param prop_types: iterable of the changed `RB.RhythmDBPropType`.
+        '''
+        changed = self._record.refresh(self.entry, prop_types)
+
+        if 'album_artist_sort' in changed:
+            self._album_artist_sort = None
+
+        if 'album_sort' in changed:
+            self._album_sort = None
+
+        return changed
+
+    def modified(self):
+        '''
+        Notifies the album holding the track that the track's data changed.
+        '''
+        if self.owner:
+            self.owner.track_modified(self)
+
+    def deleted(self):
+        '''
+        Notifies the album holding the track that the track was deleted.
+        '''
+        if self.owner:
+            self.owner.track_deleted(self)
 
     def create_ext_db_key(self):
         '''
@@ -280,73 +569,85 @@ class Album(GObject.Object):
 
         self.name = name
         self.artist = artist
+
+        # counted multisets of the values contributed by the tracks; the
+        # joined/sorted versions are cached until the set of distinct values
+        # changes
+        self._artist_counts = collections.Counter()
+        self._title_counts = collections.Counter()
+        self._composer_counts = collections.Counter()
+        self._genre_counts = collections.Counter()
+        self._year_counts = collections.Counter()
+        self._album_sort_counts = collections.Counter()
+        self._album_artist_sort_counts = collections.Counter()
         self._album_artist_sort = None
         self._album_sort = None
         self._artists = None
         self._titles = None
         self._composers = None
         self._genres = None
-        self._tracks = []
+
+        # min-heap of the years (lazily cleaned) and running sums
+        self._years = []
+        self._rating_sum = 0
+        self._duration = 0
+
+        # contribution of the last track removed, kept while the album is
+        # empty so its sort keys don't change until it's removed
+        self._last_contribution = None
+
+        # track -> contribution to the aggregates
+        self._tracks = {}
         self._cover = None
         self.cover = cover
-        self._year = None
-        self._rating = None
-        self._duration = None
 
-        self._signals_id = {}
+        # while frozen, changes are notified once the album is thawed
+        self._freeze_count = 0
+        self._changed_while_frozen = False
 
     @property
     def album_artist_sort(self):
-        if not self._album_artist_sort:
-            self._album_artist_sort = uniquify_and_sort(
-                [track.album_artist_sort for track in self._tracks])
+        if self._album_artist_sort is None:
+            self._album_artist_sort = tuple(
+                sorted(self._album_artist_sort_counts))
 
         return self._album_artist_sort
 
     @property
     def album_sort(self):
-        if not self._album_sort:
-            self._album_sort = uniquify_and_sort(
-                [track.album_sort for track in self._tracks])
+        if self._album_sort is None:
+            self._album_sort = tuple(sorted(self._album_sort_counts))
 
         return self._album_sort
 
     @property
     def artists(self):
-        if not self._artists:
-            self._artists = ', '.join(set(
-                [track.artist for track in self._tracks]))
+        if self._artists is None:
+            self._artists = ', '.join(self._artist_counts)
 
         return self._artists
 
     @property
     def track_titles(self):
-        if not self._titles:
-            self._titles = ' '.join(set(
-                [track.title for track in self._tracks]))
+        if self._titles is None:
+            self._titles = ' '.join(self._title_counts)
 
         return self._titles
 
     @property
     def composers(self):
-        if not self._composers:
-            composers = [track.composer for track in self._tracks if track.composer]
-            if composers:
-                self._composers = ' '.join(set(composers))
+        if self._composers is None and self._composer_counts:
+            self._composers = ' '.join(self._composer_counts)
 
         return self._composers
 
     @property
     def year(self):
-        if not self._year:
-            real_years = [track.year for track in self._tracks if track.year != 0]
-
-            if len(real_years) > 0:
-                self._year = min(real_years)
-            else:
-                self._year = 0
+        # discard the years whose tracks are gone
+        while self._years and self._years[0] not in self._year_counts:
+            heapq.heappop(self._years)
 
-        return self._year
+        return self._years[0] if self._years else 0
 
     @property
     def real_year(self):
@@ -372,29 +673,29 @@ class Album(GObject.Object):
 
     @property
     def genres(self):
-        if not self._genres:
-            self._genres = set([track.genre for track in self._tracks])
+        if self._genres is None:
+            self._genres = set(self._genre_counts)
 
         return self._genres
 
     @property
     def rating(self):
-        if not self._rating:
-            ratings = [track.rating for track in self._tracks
-                       if track.rating and track.rating != 0]
+        if not self._tracks:
+            # the rating of the last track, if the album was emptied
+            return self._rating_sum
 
-            if len(ratings) > 0:
-                self._rating = sum(ratings) / len(self._tracks)
-            else:
-                self._rating = 0
-        return self._rating
+        return self._rating_sum / len(self._tracks)
 
     @rating.setter
     def rating(self, new_rating):
+        modified = False
+
         for track in self._tracks:
             track.rating = new_rating
-        self._rating = None
-        self.emit('modified')
+            modified = self._update_contribution(track) or modified
+
+        if modified:
+            self._changed()
 
     @property
     def track_count(self):
@@ -402,9 +703,6 @@ class Album(GObject.Object):
 
     @property
     def duration(self):
-        if not self._duration:
-            self._duration = sum([track.duration for track in self._tracks])
-
         return self._duration
 
     @property
@@ -447,52 +745,165 @@ class Album(GObject.Object):
 
         :param track: `Track` track to be added.
         '''
-        self._tracks.append(track)
-        ids = (track.connect('modified', self._track_modified),
-               track.connect('deleted', self._track_deleted))
+        track.owner = self
+
+        if self._last_contribution:
+            self._apply_contribution(self._last_contribution, -1)
+            self._last_contribution = None
+
+        contribution = self._contribution(track)
+        self._tracks[track] = contribution
+        self._apply_contribution(contribution, 1)
 
-        self._signals_id[track] = ids
-        self.emit('modified')
+        self._changed()
 
-    def _track_modified(self, track):
-        print("_track_modified")
+    def track_modified(self, track):
+        '''
+        Updates the album with the changes of one of its tracks.
+
+        :param track: `Track` modified.
+        '''
         if track.album != self.name:
-            self._track_deleted(track)
+            self.track_deleted(track)
+        elif self._update_contribution(track):
+            self._changed()
+
+    def track_deleted(self, track):
+        '''
+        Removes a deleted track from the album.
+
+        :param track: `Track` deleted.
+        '''
+        contribution = self._tracks.pop(track)
+        track.owner = None
+
+        if self._tracks:
+            self._apply_contribution(contribution, -1)
         else:
-            self.emit('modified')
+            # an emptied album keeps the values of its last track, otherwise
+            # it couldn't be found by its sort keys when it's removed
+            self._last_contribution = contribution
 
-    def _track_deleted(self, track):
-        print("_track_deleted")
-        self._tracks.remove(track)
+        self._changed()
 
-        # list(map(track.disconnect, self._signals_id[track]))
-        for signal_id in self._signals_id[track]:
-            track.disconnect(signal_id)
+    def __contains__(self, track):
+        return track in self._tracks
 
-        del self._signals_id[track]
+    def freeze(self):
+        '''
+        Holds back the notification of changes on the album until `thaw` is
+        called, so a batch of track changes is notified just once.
+        '''
+        self._freeze_count += 1
 
-        if len(self._tracks) == 0:
+    def thaw(self):
+        '''
+        Reverts the effect of a previous call to `freeze`, notifying the
+        changes that happened meanwhile.
+        '''
+        self._freeze_count -= 1
+
+        if not self._freeze_count and self._changed_while_frozen:
+            self._changed_while_frozen = False
+            self._changed()
+
+    def _changed(self):
+        '''
+        Notifies that the album changed, or that it was emptied if it has no
+        tracks left.
+        '''
+        if self._freeze_count:
+            self._changed_while_frozen = True
+        elif self._tracks:
+            self.emit('modified')
+        else:
             self.emit('emptied')
+
+    @staticmethod
+    def _contribution(track):
+        '''
+        Returns the values a track adds to the album's aggregates.
+        '''
+        return (track.artist, track.title, track.composer, track.genre,
+                track.year, track.rating, track.duration, track.album_sort,
+                track.album_artist_sort)
+
+    def _update_contribution(self, track):
+        '''
+        Replaces the contribution of a track that has been modified. Returns
+        True if the values of the track changed.
+        '''
+        old_contribution = self._tracks[track]
+        contribution = self._contribution(track)
+
+        if contribution == old_contribution:
+            return False
+
+        self._apply_contribution(old_contribution, -1)
+        self._apply_contribution(contribution, 1)
+        self._tracks[track] = contribution
+
+        return True
+
+    def _apply_contribution(self, contribution, delta):
+        '''
+        Adds (delta=1) or removes (delta=-1) the contribution of a track to
+        the album's aggregates.
+        '''
+        artist, title, composer, genre, year, rating, duration, album_sort, \
+        album_artist_sort = contribution
+
+        if self._count(self._artist_counts, artist, delta):
+            self._artists = None
+
+        if self._count(self._title_counts, title, delta):
+            self._titles = None
+
+        if composer and self._count(self._composer_counts, composer, delta):
+            self._composers = None
+
+        if self._count(self._genre_counts, genre, delta):
+            self._genres = None
+
+        if self._count(self._album_sort_counts, album_sort, delta):
+            self._album_sort = None
+
+        if self._count(self._album_artist_sort_counts, album_artist_sort,
+                       delta):
+            self._album_artist_sort = None
+
+        if year and self._count(self._year_counts, year, delta) and delta > 0:
+            heapq.heappush(self._years, year)
+
+        if rating:
+            self._rating_sum += delta * rating
+
+        self._duration += delta * duration
+
+        if not self._tracks:
+            # avoid accumulating rounding errors
+            self._rating_sum = 0
+
+    @staticmethod
+    def _count(counter, value, delta):
+        '''
+        Updates the count of a value on a counter. Returns True if the value
+        appeared on or disappeared from the counter.
+        '''
+        count = counter[value] + delta
+
+        if count > 0:
+            counter[value] = count
+            return count == delta
         else:
-            self.emit('modified')
+            del counter[value]
+            return True
 
     def create_ext_db_key(self):
         '''
         Creates a `RB.ExtDBKey` from this album's tracks.
         '''
-        return self._tracks[0].create_ext_db_key()
-
-    def do_modified(self):
-        self._album_artist = None
-        self._album_artist_sort = None
-        self._album_sort = None
-        self._artists = None
-        self._titles = None
-        self._genres = None
-        self._year = None
-        self._rating = None
-        self._duration = None
-        self._composers = None
+        return next(iter(self._tracks)).create_ext_db_key()
 
     def __str__(self):
         return self.artist + self.name
@@ -506,121 +917,277 @@ class Album(GObject.Object):
                self.name + self.artist != other.name + other.artist
 
 
-class AlbumFilters(object):
-    @classmethod
-    def nay_filter(cls, *args):
-        def filt(*args):
-            return False
+class AlbumTextIndex(object):
+    '''
+    Keeps the searchable text fields of the albums already folded, together
+    with an inverted index that maps every folded token to the albums that
+    contain it. This allows the text filters to resolve the set of albums
+    that may match a search without folding or scanning the whole library.
+    The tokens are indexed as well by their n-grams, so the tokens containing
+    a word are found without going through all of them.
+    '''
+    fields = ('name', 'artist', 'artists', 'track_titles', 'composers')
 
-        return filt
+    # maximum number of cached word to token resolutions
+    MATCHES_CACHE_SIZE = 256
+
+    # length of the n-grams the tokens are indexed by
+    NGRAM_SIZE = 3
+
+    def __init__(self):
+        self._texts = {}
+        self._tokens = dict((field, {}) for field in self.fields)
+        self._ngrams = dict((field, {}) for field in self.fields)
+        self._matches = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __contains__(self, album):
+        return album in self._texts
+
+    def add(self, album):
+        '''
+        Indexes the text fields of an album.
+
+        :param album: `Album` to be indexed.
+        '''
+        texts = {}
+
+        for field in self.fields:
+            text = RB.search_fold(getattr(album, field) or '')
+            texts[field] = text
+            tokens = self._tokens[field]
+
+            for token in set(text.split()):
+                if token not in tokens:
+                    tokens[token] = set()
+                    self._add_ngrams(field, token)
+                    self._matches.clear()
+
+                tokens[token].add(album)
+
+        self._texts[album] = texts
+
+    def remove(self, album):
+        '''
+        Removes an album from the index.
+
+        :param album: `Album` to be removed.
+        '''
+        texts = self._texts.pop(album, None)
+
+        if not texts:
+            return
+
+        for field, text in texts.items():
+            tokens = self._tokens[field]
+
+            for token in set(text.split()):
+                albums = tokens.get(token)
+
+                if albums is None:
+                    continue
+
+                albums.discard(album)
+
+                if not albums:
+                    del tokens[token]
+                    self._remove_ngrams(field, token)
+                    self._matches.clear()
+
+    def update(self, album):
+        '''
+        Reindexes an album after it has been modified.
+
+        :param album: `Album` to be reindexed.
+        '''
+        self.remove(album)
+        self.add(album)
+
+    def text(self, album, field):
+        '''
+        Returns the folded text of a field of the album.
+        '''
+        try:
+            return self._texts[album][field]
+        except KeyError:
+            # the album isn't indexed (yet), fold it on the fly
+            return RB.search_fold(getattr(album, field) or '')
 
     @classmethod
-    def global_filter(cls, searchtext=None):
-        def filt(album):
-            # this filter is more complicated: for each word in the search
-            # text, it tries to find at least one match on the params of
-            # the album. If no match is given, then the album doesn't match
-            if not searchtext:
-                return True
+    def _token_ngrams(cls, token):
+        size = cls.NGRAM_SIZE
+
+        return set(token[i:i + size] for i in range(len(token) - size + 1))
+
+    def _add_ngrams(self, field, token):
+        ngrams = self._ngrams[field]
 
-            words = RB.search_fold(searchtext).split()
-            params = list(map(RB.search_fold, [album.name, album.artist,
-                                               album.artists, album.track_titles, album.composers]))
-            matches = []
+        for ngram in self._token_ngrams(token):
+            ngrams.setdefault(ngram, set()).add(token)
 
-            for word in words:
-                match = False
+    def _remove_ngrams(self, field, token):
+        ngrams = self._ngrams[field]
 
-                for param in params:
-                    if word in param:
-                        match = True
+        for ngram in self._token_ngrams(token):
+            tokens = ngrams[ngram]
+            tokens.discard(token)
+
+            if not tokens:
+                del ngrams[ngram]
+
+    def _matching_tokens(self, field, word):
+        key = (field, word)
+
+        if key not in self._matches:
+            if len(self._matches) >= self.MATCHES_CACHE_SIZE:
+                self._matches.clear()
+
+            if len(word) >= self.NGRAM_SIZE:
+                # only the tokens having all the n-grams of the word may
+                # contain it
+                ngrams = self._ngrams[field]
+                candidates = None
+
+                for tokens in sorted((ngrams.get(ngram, ())
+                                      for ngram in self._token_ngrams(word)),
+                                     key=len):
+                    candidates = set(tokens) if candidates is None \
+                        else candidates & tokens
+
+                    if not candidates:
                         break
+            else:
+                # a shorter word is looked for among the tokens containing it
+                # without its last letter (the previous keystroke), if known
+                candidates = self._matches.get((field, word[:-1]),
+                                               self._tokens[field])
 
-                matches.append(match)
+            self._matches[key] = [token for token in candidates
+                                  if word in token]
 
-            return False not in matches
+        return self._matches[key]
 
-        return filt
+    def candidates(self, words, fields):
+        '''
+        Returns the set of albums where every one of the folded words appears
+        on at least one of the given fields. Since a word never contains
+        whitespace, it can only be found inside a single token of the text,
+        so the result is a superset of the albums the filters accept.
 
-    @classmethod
-    def album_artist_filter(cls, searchtext=None):
-        def filt(album):
-            if not searchtext:
-                return True
+        :param words: `list` of folded words.
+        :param fields: `tuple` with the name of the fields to look into.
+        '''
+        result = None
 
-            return RB.search_fold(searchtext) in RB.search_fold(album.artist)
+        for word in words:
+            albums = set()
 
-        return filt
+            for field in fields:
+                tokens = self._tokens[field]
 
-    @classmethod
-    def artist_filter(cls, searchtext=None):
-        def filt(album):
-            if not searchtext:
-                return True
+                for token in self._matching_tokens(field, word):
+                    albums.update(tokens[token])
+
+            result = albums if result is None else result & albums
+
+            if not result:
+                break
+
+        return set(self._texts) if result is None else result
 
-            return RB.search_fold(searchtext) in RB.search_fold(album.artists)
+
+class AlbumFilters(object):
+    @classmethod
+    def nay_filter(cls, *args):
+        def filt(*args):
+            return False
 
         return filt
 
     @classmethod
-    def similar_artist_filter(cls, searchtext=None):
-        def filt(album):
-            # this filter is more complicated: for each word in the search
-            # text, it tries to find at least one match on the params of
-            # the album. If no match is given, then the album doesn't match
-            if not searchtext:
-                return True
+    def _text_filter(cls, searchtext, fields, split, index):
+        '''
+        Creates a filter that looks for the folded searchtext on the given
+        album fields.
 
-            words = RB.search_fold(searchtext).split()
-            params = list(map(RB.search_fold, [album.artist,
-                                               album.artists]))
-            matches = []
+        If split is True, each word of the searchtext must be found on at
+        least one of the fields, otherwise the whole searchtext must be found
+        on one of them. When an `AlbumTextIndex` is given, the filter exposes
+        a `candidates` method that returns the albums accepted by the filter
+        without testing every album of the index.
+        '''
+        if not searchtext:
+            return lambda album: True
 
-            for word in words:
-                match = False
+        folded = RB.search_fold(searchtext)
+        words = folded.split()
 
-                for param in params:
-                    if word in param:
-                        match = True
-                        break
+        def text(album, field):
+            if index:
+                return index.text(album, field)
+
+            return RB.search_fold(getattr(album, field) or '')
+
+        if split:
+            def filt(album):
+                params = [text(album, field) for field in fields]
+
+                for word in words:
+                    for param in params:
+                        if word in param:
+                            break
+                    else:
+                        return False
 
-                matches.append(match)
+                return True
+        else:
+            def filt(album):
+                for field in fields:
+                    if folded in text(album, field):
+                        return True
+
+                return False
 
-            return False not in matches
+        if index:
+            filt.candidates = lambda: set(
+                filter(filt, index.candidates(words, fields)))
 
         return filt
 
     @classmethod
-    def album_name_filter(cls, searchtext=None):
-        def filt(album):
-            if not searchtext:
-                return True
-
-            return RB.search_fold(searchtext) in RB.search_fold(album.name)
-
-        return filt
+    def global_filter(cls, searchtext=None, index=None):
+        # this filter is more complicated: for each word in the search
+        # text, it tries to find at least one match on the params of
+        # the album. If no match is given, then the album doesn't match
+        return cls._text_filter(searchtext, AlbumTextIndex.fields, True,
+                                index)
 
     @classmethod
-    def track_title_filter(cls, searchtext=None):
-        def filt(album):
-            if not searchtext:
-                return True
+    def album_artist_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('artist',), False, index)
 
-            return RB.search_fold(searchtext) in RB.search_fold(
-                album.track_titles)
+    @classmethod
+    def artist_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('artists',), False, index)
 
-        return filt
+    @classmethod
+    def similar_artist_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('artist', 'artists'), True,
+                                index)
 
     @classmethod
-    def composer_filter(cls, searchtext=None):
-        def filt(album):
-            if not searchtext:
-                return True
+    def album_name_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('name',), False, index)
 
-            return RB.search_fold(searchtext) in RB.search_fold(
-                album.composers)
+    @classmethod
+    def track_title_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('track_titles',), False, index)
 
-        return filt
+    @classmethod
+    def composer_filter(cls, searchtext=None, index=None):
+        return cls._text_filter(searchtext, ('composers',), False, index)
 
     @classmethod
     def genre_filter(cls, searchtext=None):
@@ -642,7 +1209,7 @@ class AlbumFilters(object):
 
         for row in model:
             entry = model[row.path][0]
-            albums.add(Track(entry).album)
+            albums.add(entry.get_string(RB.RhythmDBPropType.ALBUM))
 
         def filt(album):
             return album.name in albums
@@ -693,6 +1260,19 @@ AlbumFilters.keys = {
     'decade': AlbumFilters.decade_filter
 }
 
+# filters that can be resolved against the `AlbumTextIndex` of the model
+AlbumFilters.indexed_keys = set(['all', 'album_artist', 'artist',
+                                 'quick_artist', 'composers', 'similar_artist',
+                                 'album_name', 'track'])
+
+# filters that match their text argument as a substring of the album's data
+AlbumFilters.text_keys = AlbumFilters.indexed_keys | set(['genre'])
+
+# kinds of change between two consecutive refilters
+FILTER_NARROW = 'narrow'
+FILTER_WIDEN = 'widen'
+FILTER_FULL = 'full'
+
 sort_keys = {
     'name': ('album_sort', 'album_sort'),
     'artist': ('album_artist_sort', 'album_artist_sort'),
@@ -720,7 +1300,11 @@ class AlbumsModel(GObject.Object):
         'album-updated': ((GObject.SIGNAL_RUN_LAST, None, (object, object))),
         'visual-updated': ((GObject.SIGNAL_RUN_LAST, None, (object, object))),
         'filter-changed': ((GObject.SIGNAL_RUN_FIRST, None, ())),
-        'album-added': ((GObject.SIGNAL_RUN_LAST, None, (object,)))
+        'album-added': ((GObject.SIGNAL_RUN_LAST, None, (object,))),
+        'album-removed': ((GObject.SIGNAL_RUN_LAST, None, (object,))),
+        'visibility-batch': ((GObject.SIGNAL_RUN_LAST, None, (bool,))),
+        'visibility-changed': ((GObject.SIGNAL_RUN_LAST, None,
+                                (object, object)))
     }
 
     # list of columns names and positions on the TreeModel
@@ -740,8 +1324,21 @@ class AlbumsModel(GObject.Object):
         # filters
         self._filters = {}
 
-        # sorting idle call
-        self._sort_process = None
+        # pre-folded text of the albums used by the text filters
+        self._index = AlbumTextIndex()
+
+        # arguments of the current filters and the filters applied on the
+        # last refilter, used to detect if the filtering narrows or widens
+        self._filter_args = {}
+        self._applied_filters = {}
+
+        # every album gets a slot number used to track its visibility
+        self._slots = {}
+        self._slot_albums = []
+        self._free_slots = []
+
+        # slots of the albums currently shown on the filtered store
+        self._visible = Bitset()
 
         # create the filtered store that's used with the view
         self._filtered_store = self._tree_store.filter_new()
@@ -770,6 +1367,9 @@ class AlbumsModel(GObject.Object):
         print("_album_modified")
         tree_iter = self._iters[album.name][album.artist]['iter']
 
+        # keep the text index in sync before filtering the album again
+        self._index.update(album)
+
         if self._tree_store.iter_is_valid(tree_iter):
             # only update if the iter is valid
             # generate and update values
@@ -778,6 +1378,7 @@ class AlbumsModel(GObject.Object):
 
             self._tree_store.set(tree_iter, self.columns['tooltip'], tooltip,
                                  self.columns['markup'], markup, self.columns['show'], hidden)
+            self._set_visible(album, hidden)
 
             # reorder the album
             new_pos = self._albums.reorder(album)
@@ -831,10 +1432,14 @@ class AlbumsModel(GObject.Object):
         :param album: `Album` to be added to the model.
         '''
 
+        self._index.add(album)
+        self._allocate_slot(album)
+
         # generate necessary values
         values = self._generate_values(album)
         # insert the values
         tree_iter = self._tree_store.insert(self._albums.insert(album), values)
+        self._set_visible(album, values[self.columns['show']])
         # connect signals
         ids = (album.connect('modified', self._album_modified),
                album.connect('cover-updated', self._cover_updated),
@@ -862,7 +1467,11 @@ class AlbumsModel(GObject.Object):
         '''
         print("album model remove")
         print(album)
+        self._set_visible(album, False)
+
         self._albums.remove(album)
+        self._index.remove(album)
+        self._release_slot(album)
         self._tree_store.remove(self._iters[album.name][album.artist]['iter'])
 
         # disconnect signals
@@ -871,6 +1480,8 @@ class AlbumsModel(GObject.Object):
 
         del self._iters[album.name][album.artist]
 
+        self.emit('album-removed', album)
+
     def contains(self, album_name, album_artist):
         '''
         Indicates if the model contains a specific album.
@@ -946,7 +1557,7 @@ class AlbumsModel(GObject.Object):
 
     def find_first_visible(self, filter_key, filter_arg, start=None,
                            backwards=False):
-        album_filter = AlbumFilters.keys[filter_key](filter_arg)
+        album_filter = self._create_filter(filter_key, filter_arg)
 
         albums = reversed(self._albums) if backwards else self._albums
         ini = albums.index(start) + 1 if start else 0
@@ -972,23 +1583,45 @@ class AlbumsModel(GObject.Object):
 
         if self._tree_store.iter_is_valid(album_iter):
             self._tree_store.set_value(album_iter, self.columns['show'], show)
+            self._set_visible(album, show)
 
-    @idle_iterator
-    def _sort(self):
-        def process(album, data):
-            values = self._generate_values(album)
+    def _allocate_slot(self, album):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_albums[slot] = album
+        else:
+            slot = len(self._slot_albums)
+            self._slot_albums.append(album)
 
-            tree_iter = self._tree_store.append(values)
-            self._iters[album.name][album.artist]['iter'] = tree_iter
+        self._slots[album] = slot
 
-        def error(exception):
-            print('Error(1) while adding albums to the model: ' + str(exception))
+    def _release_slot(self, album):
+        slot = self._slots.pop(album)
 
-        def finish(data):
-            self._sort_process = None
-            self.remove_filter('nay')
+        self._visible.discard(slot)
+        self._slot_albums[slot] = None
+        self._free_slots.append(slot)
 
-        return ALBUM_LOAD_CHUNK, process, None, error, finish
+    def _set_visible(self, album, show):
+        slot = self._slots[album]
+
+        if show == (slot in self._visible):
+            return
+
+        if show:
+            self._visible.add(slot)
+            self.emit('visibility-changed', [album], [])
+        else:
+            self._visible.discard(slot)
+            self.emit('visibility-changed', [], [album])
+
+    def is_visible(self, album):
+        '''
+        Indicates if an album is shown on the filtered model.
+
+        :param album: `Album` contained in the model.
+        '''
+        return self._slots[album] in self._visible
 
     def sort(self):
         '''
@@ -1029,23 +1662,30 @@ class AlbumsModel(GObject.Object):
         print(key)
         print(reverse)
         if key:
+            # the rows of the store follow the current order of the albums,
+            # remember it to calculate the permutation to the new order
+            positions = dict((album, pos) for pos, album in
+                             enumerate(self._albums))
+
             props = sort_keys[key]
             self._albums.key = key_function
 
-        if reverse:
-            self._albums = reversed(self._albums)
+            if reverse:
+                self._albums = reversed(self._albums)
 
-        self._tree_store.clear()
+            new_order = [positions[album] for album in self._albums]
+        else:
+            # flipping the order is a plain reversal of the rows
+            self._albums = reversed(self._albums)
 
-        # add the nay filter
-        self.replace_filter('nay', refilter=False)
+            new_order = list(range(len(self._albums) - 1, -1, -1))
 
-        if self._sort_process:
-            # stop the previous sort process if there's one
-            self._sort_process.stop()
+        # move the rows in place, their values and iters stay untouched
+        self._tree_store.reorder(new_order)
 
-        # load the albums back to the model
-        self._sort_process = self._sort(iter(self._albums))
+        # views that rebuild their contents from the filtered store also
+        # need to know about the new order
+        self.emit('filter-changed')
 
     def replace_filter(self, filter_key, filter_arg=None, refilter=True):
         '''
@@ -1058,10 +1698,15 @@ class AlbumsModel(GObject.Object):
         :param refilter: `bool` indicating whether to force a refilter and
         emit the 'filter-changed' signal(True) or not(False).
         '''
-        self._filters[filter_key] = AlbumFilters.keys[filter_key](filter_arg)
+        self._filters[filter_key] = self._create_filter(filter_key, filter_arg)
+        self._filter_args[filter_key] = filter_arg
 
         if refilter:
             self.emit('filter-changed')
+        else:
+            # the filters applied to the albums are unknown until the next
+            # refilter, so it must go through all the albums
+            self._applied_filters = None
 
     def remove_filter(self, filter_key, refilter=True):
         '''
@@ -1074,9 +1719,12 @@ class AlbumsModel(GObject.Object):
         '''
         if filter_key in self._filters:
             del self._filters[filter_key]
+            del self._filter_args[filter_key]
 
             if refilter:
                 self.emit('filter-changed')
+            else:
+                self._applied_filters = None
 
     def clear_filters(self):
         '''
@@ -1084,17 +1732,164 @@ class AlbumsModel(GObject.Object):
         '''
         if self._filters:
             self._filters.clear()
+            self._filter_args.clear()
 
             self.emit('filter-changed')
 
+    def _create_filter(self, filter_key, filter_arg):
+        if filter_key in AlbumFilters.indexed_keys:
+            return AlbumFilters.keys[filter_key](filter_arg, self._index)
+
+        return AlbumFilters.keys[filter_key](filter_arg)
+
+    def _filter_change(self):
+        '''
+        Compares the current filters with the ones applied on the last
+        refilter. Returns `FILTER_NARROW` if the current filters can only hide
+        albums that are visible, `FILTER_WIDEN` if they can only show albums
+        that are hidden, `FILTER_FULL` if every album has to be tested again
+        or None if the filters haven't changed.
+        '''
+        applied = self._applied_filters
+
+        if applied is None:
+            return FILTER_FULL
+
+        narrow = widen = False
+
+        for key in set(applied) | set(self._filters):
+            if key not in applied:
+                # a new filter can only hide albums
+                narrow = True
+            elif key not in self._filters:
+                # removing a filter can only show albums
+                widen = True
+            elif applied[key][0] is not self._filters[key]:
+                if key not in AlbumFilters.text_keys:
+                    return FILTER_FULL
+
+                # text filters match substrings, so extending the text
+                # narrows the results and shortening it widens them
+                old = RB.search_fold(applied[key][1] or '')
+                new = RB.search_fold(self._filter_args[key] or '')
+
+                if new.startswith(old):
+                    narrow = True
+                elif old.startswith(new):
+                    widen = True
+                else:
+                    return FILTER_FULL
+
+        if narrow and widen:
+            return FILTER_FULL
+        elif narrow:
+            return FILTER_NARROW
+        elif widen:
+            return FILTER_WIDEN
+
+        return None
+
     def do_filter_changed(self):
-        pos = 0
-        for show_result in list(map(self._album_filter, self._albums)):
-            self.show(self._albums[pos], show_result)
-            pos = pos + 1
+        change = self._filter_change()
+
+        self._applied_filters = dict(
+            (key, (f, self._filter_args[key]))
+            for key, f in self._filters.items())
+
+        if change == FILTER_NARROW:
+            # only the visible albums may get hidden
+            visible = self._visible.copy()
+
+            for slot in self._visible:
+                if not self._album_filter(self._slot_albums[slot]):
+                    visible.discard(slot)
+        elif change == FILTER_WIDEN:
+            # only the hidden albums may get shown
+            visible = self._visible.copy()
+
+            for slot, album in enumerate(self._slot_albums):
+                if album and slot not in self._visible and \
+                        self._album_filter(album):
+                    visible.add(slot)
+        elif change == FILTER_FULL:
+            visible = self._refilter()
+        else:
+            return
+
+        self._apply_visibility(visible)
+
+    def _apply_visibility(self, visible):
+        '''
+        Updates the show column of the albums whose visibility differs from
+        the given `Bitset`. If there are many changes, the views are asked to
+        detach from the model through the 'visibility-batch' signal, so they
+        don't have to process each change individually.
+        '''
+        slots = self._visible.symmetric_difference(visible)
+        self._visible = visible
+
+        if not slots:
+            return
+
+        batch = len(slots) > VISIBILITY_BATCH_THRESHOLD
+
+        if batch:
+            self.emit('visibility-batch', True)
+
+        show_column = self.columns['show']
+        shown = []
+        hidden = []
+
+        for slot in slots:
+            album = self._slot_albums[slot]
+            album_iter = self._iters[album.name][album.artist]['iter']
+
+            if slot in visible:
+                shown.append(album)
+            else:
+                hidden.append(album)
+
+            if self._tree_store.iter_is_valid(album_iter):
+                self._tree_store.set_value(album_iter, show_column,
+                                           slot in visible)
+
+        if batch:
+            self.emit('visibility-batch', False)
+
+        # let know which albums changed, so others don't need to go through
+        # all the albums
+        self.emit('visibility-changed', shown, hidden)
+
+    def _refilter(self):
+        # resolve the indexed filters to a set of candidates first, so only
+        # those albums need to be tested against the rest of the filters
+        candidates = None
+        filters = []
 
-    def _album_filter(self, album):
         for f in list(self._filters.values()):
+            if hasattr(f, 'candidates'):
+                albums = f.candidates()
+                candidates = albums if candidates is None \
+                    else candidates & albums
+            else:
+                filters.append(f)
+
+        if candidates is None:
+            candidates = self._albums
+
+        visible = Bitset(len(self._slot_albums))
+
+        for album in candidates:
+            if self._album_filter(album, filters):
+                visible.add(self._slots[album])
+
+        return visible
+
+    def _album_filter(self, album, filters=None):
+        if filters is None:
+            filters = list(self._filters.values())
+
+        for f in filters:
             if not f(album):
                 return False
 
@@ -1107,6 +1902,119 @@ class AlbumsModel(GObject.Object):
         self._recreate_text(iter(self._albums))
 
 
+class AlbumCatalog(object):
+    '''
+    Persistent snapshot of the albums, with their tracks, sort keys and
+    covers' locations. It allows to show the albums right away on startup
+    while the loader reconciles them with Rhythmbox's database.
+
+    :param filename: `str` path of the file where the catalog is kept.
+    '''
+    VERSION = 1
+
+    def __init__(self, filename=None):
+        if not filename:
+            filename = os.path.join(RB.user_cache_dir(), 'coverart_browser',
+                                    'catalog.json')
+
+        self.filename = filename
+        # the catalog is written on separate threads
+        self._write_lock = threading.Lock()
+
+    def read(self):
+        '''
+        Reads the catalog and returns the data of its albums, as a list to be
+        given to `create_album`. Returns None if there's no valid catalog.
+        It only parses the file, so it can be called from any thread.
+        '''
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as catalog_file:
+                catalog = json.load(catalog_file)
+        except (IOError, ValueError) as e:
+            print('No album catalog available: ' + str(e))
+            return None
+
+        if not isinstance(catalog, dict) or \
+                catalog.get('version') != self.VERSION or \
+                not isinstance(catalog.get('albums'), list):
+            return None
+
+        return catalog['albums']
+
+    @staticmethod
+    def create_album(data, db, unknown_cover):
+        '''
+        Creates an album, with its tracks, from its data on the catalog.
+        Returns a tuple with the album and the location of its cover, if any.
+        Raises KeyError, TypeError or ValueError if the data isn't valid.
+
+        :param data: `dict` with the album's data, as returned by `read`.
+        :param db: `RB.RhythmDB` used to look up the tracks' entries.
+        :param unknown_cover: `Cover` given to the album until its cover is
+            loaded.
+        '''
+        if not isinstance(data['name'], str) or \
+                not isinstance(data['artist'], str):
+            raise TypeError('invalid album ' + repr(data['name']))
+
+        album = Album(data['name'], data['artist'], unknown_cover)
+
+        for values, album_sort, album_artist_sort in data['tracks']:
+            album.add_track(Track(None, db, TrackRecord.restore(values),
+                                  (tuple(album_sort),
+                                   tuple(album_artist_sort))))
+
+        return album, data['cover']
+
+    @staticmethod
+    def dump_album(album, unknown_cover):
+        '''
+        Returns the data of an album, with its tracks, to be stored on the
+        catalog. The data doesn't refer to the album, so it can be written
+        from any thread.
+
+        :param album: `Album` to store.
+        :param unknown_cover: `Cover` used by the albums without a cover.
+        '''
+        cover = album.cover
+
+        return {
+            'name': album.name,
+            'artist': album.artist,
+            'cover': cover.original if cover is not unknown_cover else None,
+            'tracks': [(track.record.dump(), track.album_sort,
+                        track.album_artist_sort)
+                       for track in album.get_tracks()]}
+
+    def save(self, albums):
+        '''
+        Writes the catalog with the given albums. It only writes the file, so
+        it can be called from any thread.
+
+        :param albums: `list` of the albums' data, as returned by
+            `dump_album`.
+        '''
+        catalog = {'version': self.VERSION, 'albums': albums}
+
+        with self._write_lock:
+            self._write(catalog)
+
+    def _write(self, catalog):
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+            # write to a temporary file first, so a failure never leaves a
+            # truncated catalog behind
+            temp_filename = self.filename + '.tmp'
+
+            with open(temp_filename, 'w', encoding='utf-8') as catalog_file:
+                json.dump(catalog, catalog_file)
+
+            os.replace(temp_filename, self.filename)
+        except (IOError, OSError) as e:
+            print('Error while saving the album catalog: ' + str(e))
+
+
 class AlbumLoader(GObject.Object):
     '''
     Loads and updates Rhythmbox's tracks and albums, updating the model
@@ -1126,6 +2034,18 @@ class AlbumLoader(GObject.Object):
         self._album_manager = album_manager
         self._tracks = {}
 
+        # entry changes waiting to be applied, by location
+        self._pending = collections.OrderedDict()
+        self._pending_id = None
+        self._frozen_albums = None
+
+        # albums snapshot and the query model to reconcile it with
+        self._catalog = AlbumCatalog()
+        self._reconcile_model = None
+        self._loaded = False
+        self._save_generation = 0
+        self.cover_locations = {}
+
         self._connect_signals()
 
     def _connect_signals(self):
@@ -1164,9 +2084,7 @@ class AlbumLoader(GObject.Object):
 
         def after(data):
             # update the progress
-            data['progress'] += ALBUM_LOAD_CHUNK
-
-            self._album_manager.progress = data['progress'] / data['total']
+            self._album_manager.progress = data['processed'] / data['total']
 
         def error(exception):
             print('Error processing entries: ' + str(exception))
@@ -1177,6 +2095,53 @@ class AlbumLoader(GObject.Object):
 
         return ALBUM_LOAD_CHUNK, process, after, error, finish
 
+    @idle_iterator
+    def _load_catalog(self):
+        def process(album_data, data):
+            if data['invalid']:
+                return
+
+            try:
+                album, cover = AlbumCatalog.create_album(
+                    album_data, self._album_manager.db,
+                    self._album_manager.cover_man.unknown_cover)
+            except (KeyError, TypeError, ValueError) as e:
+                print('Invalid album catalog: ' + str(e))
+                data['invalid'] = True
+                return
+
+            for track in album.get_tracks():
+                self._tracks[track.location] = track
+
+            if cover:
+                data['covers'][album] = cover
+
+            data['albums'].setdefault(album.name, {})[album.artist] = album
+
+        def after(data):
+            # update the progress
+            self._album_manager.progress = data['processed'] / data['total']
+
+        def error(exception):
+            print('Error processing the album catalog: ' + str(exception))
+
+        def finish(data):
+            query_model = data['model']
+
+            if data['invalid']:
+                # load all the albums from the database instead
+                self._tracks = {}
+                self._load_albums(iter(query_model), albums={},
+                                  model=query_model, total=len(query_model))
+                return
+
+            self._album_manager.progress = 1
+            self.cover_locations = data['covers']
+            self._reconcile_model = query_model
+            self.emit('albums-load-finished', data['albums'])
+
+        return ALBUM_LOAD_CHUNK, process, after, error, finish
+
     @idle_iterator
     def _load_model(self):
         def process(albums, data):
@@ -1185,10 +2150,8 @@ class AlbumLoader(GObject.Object):
                 self._album_manager.model.add(album)
 
         def after(data):
-            data['progress'] += ALBUM_LOAD_CHUNK
-
             # update the progress
-            self._album_manager.progress = 1 - data['progress'] / data['total']
+            self._album_manager.progress = 1 - data['processed'] / data['total']
 
         def error(exception):
             dumpstack("Something awful happened!")
@@ -1201,136 +2164,486 @@ class AlbumLoader(GObject.Object):
 
         return ALBUM_LOAD_CHUNK, process, after, error, finish
 
+    @idle_iterator
+    def _reconcile(self):
+        def process(row, data):
+            entry = data['model'][row.path][0]
+            location = entry.get_string(RB.RhythmDBPropType.LOCATION)
+            data['locations'].add(location)
+
+            if location not in self._tracks:
+                self._queue_change(location, entry, added=True)
+            else:
+                track = self._tracks[location]
+                track.entry = entry
+
+                if not track.record.matches(entry):
+                    self._queue_change(location, entry,
+                                       TrackRecord.prop_types())
+
+        def error(exception):
+            print('Error while reconciling the albums: ' + str(exception))
+
+        def finish(data):
+            # the tracks that are no longer on the database
+            for location in set(self._tracks) - data['locations']:
+                self._queue_change(location, deleted=True)
+
+            self._process_pending()
+            self._loaded = True
+            self.save_catalog()
+
+        return ALBUM_LOAD_CHUNK, process, None, error, finish
+
     def _entry_changed_callback(self, db, entry, changes):
-        print("CoverArtBrowser DEBUG - entry_changed_callback")
         # NOTE: changes are packed in array of rhythmdbentrychange
+        self._queue_change(entry.get_string(RB.RhythmDBPropType.LOCATION),
+                           entry, [change.prop for change in changes])
 
-        def analyse_change(change):
-            print(change.prop)
-            if change.prop is RB.RhythmDBPropType.ALBUM \
-                    or change.prop is RB.RhythmDBPropType.ALBUM_ARTIST \
-                    or change.prop is RB.RhythmDBPropType.ARTIST \
-                    or change.prop is RB.RhythmDBPropType.ALBUM_SORTNAME \
-                    or change.prop is RB.RhythmDBPropType.ALBUM_ARTIST_SORTNAME:
-                # called when the album of a entry is modified
-                track.emit('deleted')
-                track.emit('modified')
-                print("change prop album or artist")
-                self._allocate_track(track)
+    def _entry_added_callback(self, db, entry):
+        self._queue_change(entry.get_string(RB.RhythmDBPropType.LOCATION),
+                           entry, added=True)
 
-            elif change.prop is RB.RhythmDBPropType.HIDDEN:
-                # called when an entry gets hidden (e.g.:the sound file is
-                # removed.
-                print(change)
-                if change.new:
-                    print("change prop new")
-                    track.emit('deleted')
-                else:
-                    print("change prop dunno")
-                    self._allocate_track(track)
+    def _entry_deleted_callback(self, db, entry):
+        self._queue_change(entry.get_string(RB.RhythmDBPropType.LOCATION),
+                           entry, deleted=True)
+
+    def _queue_change(self, location, entry=None, prop_types=(), added=False,
+                      deleted=False):
+        '''
+        Queues a change of an entry. Changes are coalesced per track and
+        applied together on the next idle pass.
+        '''
+        if location not in self._pending:
+            self._pending[location] = {'entry': entry, 'props': set(),
+                                       'added': False, 'deleted': False}
+
+        change = self._pending[location]
+        change['props'].update(prop_types)
+
+        if added:
+            change['entry'] = entry
+            change['added'] = True
+        elif deleted:
+            # a deletion cancels a previous addition of the same batch
+            change['added'] = False
+            change['deleted'] = True
+
+        if not self._pending_id:
+            self._pending_id = Gdk.threads_add_idle(
+                GLib.PRIORITY_DEFAULT_IDLE, self._process_pending, None)
+
+    def _process_pending(self, *args):
+        pending = self._pending
+        self._pending = collections.OrderedDict()
+        self._pending_id = None
+
+        # the albums touched by this batch are frozen so each one is updated
+        # just once
+        self._frozen_albums = set()
 
         try:
-            # look at all the changes and update the albums accordingly
-            track = self._tracks[Track(entry).location]
+            for location, change in pending.items():
+                if change['deleted']:
+                    self._remove_track(location)
+
+                if change['added']:
+                    self._allocate_track(Track(change['entry'],
+                                               self._album_manager.db))
+                elif change['props'] and not change['deleted']:
+                    self._update_track(location, change['props'])
+        except Exception as e:
+            dumpstack("Something awful happened!")
+            print('Error while updating the albums: ' + str(e))
+        finally:
+            frozen_albums = self._frozen_albums
+            self._frozen_albums = None
 
-            # RB3 has a simple rhythmdbentrychange array to deal with so we
-            #just need to loop each element of the array
+            for album in frozen_albums:
+                album.thaw()
 
-            for change in changes:
-                analyse_change(change)
-        except:
-            pass
-            
-        print("CoverArtBrowser DEBUG - end entry_changed_callback")
+        return False
 
-    def _entry_added_callback(self, db, entry):
-        print("CoverArtBrowser DEBUG - entry_added_callback")
-        self._allocate_track(Track(entry, db))
+    @staticmethod
+    def _album_key(track):
+        '''
+        Returns the name and artist of the album a track belongs to.
+        '''
+        album_artist = track.album_artist if track.album_artist \
+            else track.artist
 
-        print("CoverArtBrowser DEBUG - end entry_added_callback")
+        return track.album, album_artist
 
-    def _entry_deleted_callback(self, db, entry):
-        print("CoverArtBrowser DEBUG - entry_deleted_callback")
-        prototype = Track(entry).location
+    def _freeze_album(self, track):
+        '''
+        Freezes the album that currently contains the track, if any, and
+        returns it.
+        '''
+        album_name, album_artist = self._album_key(track)
+        model = self._album_manager.model
+
+        if not model.contains(album_name, album_artist):
+            return None
+
+        album = model.get(album_name, album_artist)
 
-        if prototype in self._tracks:
+        if self._frozen_albums is not None and \
+                album not in self._frozen_albums:
+            album.freeze()
+            self._frozen_albums.add(album)
+
+        return album
+
+    def _remove_track(self, location):
+        if location in self._tracks:
             # gotta check if the track is loaded first
-            track = self._tracks[prototype]
-            del self._tracks[track.location]
+            track = self._tracks[location]
+            del self._tracks[location]
+
+            self._freeze_album(track)
+            track.deleted()
 
-            track.emit('deleted')
+    def _update_track(self, location, prop_types):
+        if location not in self._tracks:
+            return
+
+        track = self._tracks[location]
+
+        # freeze the current album before the track's snapshot changes
+        album = self._freeze_album(track)
+        album_key = self._album_key(track)
+        changed = track.refresh(prop_types)
+        allocated = album is not None and track in album
+
+        if RB.RhythmDBPropType.HIDDEN in prop_types:
+            # called when an entry gets hidden (e.g.:the sound file is
+            # removed) or shown again
+            if track.entry.get_boolean(RB.RhythmDBPropType.HIDDEN):
+                if allocated:
+                    track.deleted()
+                return
+            elif not allocated:
+                self._allocate_track(track)
+                return
+
+        if not allocated:
+            return
 
-        print("CoverArtBrowser DEBUG - end entry_deleted_callback")
+        if self._album_key(track) != album_key:
+            # the album of the entry changed, so move it
+            track.deleted()
+            self._allocate_track(track)
+        elif changed:
+            # the album only notifies a change if its information actually
+            # changed
+            track.modified()
 
     def _allocate_track(self, track):
         if track.duration > 0 and track.is_saveable:
             # only allocate the track if it's a valid track
             self._tracks[track.location] = track
 
-            album_name = track.album
-            album_artist = track.album_artist
-            album_artist = album_artist if album_artist else track.artist
+            album = self._freeze_album(track)
 
-            if self._album_manager.model.contains(album_name, album_artist):
-                print("allocate track - contains")
-                album = self._album_manager.model.get(album_name, album_artist)
-                print(album)
+            if album:
                 album.add_track(track)
             else:
-                print("allocate track - does not contain")
+                album_name, album_artist = self._album_key(track)
                 album = Album(album_name, album_artist,
                               self._album_manager.cover_man.unknown_cover)
-                print(album)
                 album.add_track(track)
                 self._album_manager.cover_man.load_cover(album)
                 self._album_manager.model.add(album)
 
-    def load_albums(self, query_model):
+    def load_albums(self, query_model):
+        '''
+        Loads and creates `Track` instances for all entries on query_model,
+        assigning them into their correspondant `Album`.
+        If there's a catalog from a previous session, the albums are taken
+        from it and reconciled with query_model once they are on the model.
+        '''
+        print("CoverArtBrowser DEBUG - load_albums")
+
+        # the catalog is parsed on a thread, so a big one doesn't block the
+        # main loop
+        thread = threading.Thread(target=self._read_catalog,
+                                  args=(query_model,))
+        thread.daemon = True
+        thread.start()
+
+    def _read_catalog(self, query_model):
+        # NOTE: this runs on its own thread
+        catalog = self._catalog.read()
+
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self._catalog_read,
+                             (query_model, catalog))
+
+    def _catalog_read(self, data):
+        query_model, catalog = data
+
+        if catalog:
+            # the albums are created from the catalog in chunks
+            self._load_catalog(iter(catalog), albums={}, covers={},
+                               model=query_model, invalid=False,
+                               total=len(catalog))
+        else:
+            self._load_albums(iter(query_model), albums={}, model=query_model,
+                              total=len(query_model))
+
+        print("CoverArtBrowser DEBUG - load_albums finished")
+
+        return False
+
+    def save_catalog(self, now=False):
+        '''
+        Stores the current albums on the catalog, so they can be shown right
+        away the next time the albums are loaded. The albums' data is taken
+        in idle chunks and the file is written on a separate thread.
+
+        :param now: `bool` take the albums' data at once, for when the main
+            loop won't run anymore (e.g. the plugin is being deactivated).
+        '''
+        if not self._loaded:
+            return
+
+        # a newer save makes the ones still in progress useless
+        self._save_generation += 1
+        albums = list(self._album_manager.model.get_all())
+
+        if now:
+            unknown_cover = self._album_manager.cover_man.unknown_cover
+            self._write_catalog([AlbumCatalog.dump_album(album, unknown_cover)
+                                 for album in albums if album.track_count])
+        else:
+            self._save_catalog(iter(albums), albums=[],
+                               generation=self._save_generation)
+
+    @idle_iterator
+    def _save_catalog(self):
+        def process(album, data):
+            if data['generation'] == self._save_generation and \
+                    album.track_count:
+                data['albums'].append(AlbumCatalog.dump_album(
+                    album, self._album_manager.cover_man.unknown_cover))
+
+        def error(exception):
+            print('Error while saving the album catalog: ' + str(exception))
+
+        def finish(data):
+            if data['generation'] == self._save_generation:
+                self._write_catalog(data['albums'])
+
+        return ALBUM_LOAD_CHUNK, process, None, error, finish
+
+    def _write_catalog(self, albums):
+        # not a daemon thread, so the catalog is fully written before
+        # Rhythmbox exits
+        thread = threading.Thread(target=self._catalog.save, args=(albums,))
+        thread.start()
+
+    def do_albums_load_finished(self, albums):
+        # load the albums to the model
+        self._album_manager.model.replace_filter('nay')
+        self._load_model(iter(list(albums.values())), total=len(albums))
+
+    def do_model_load_finished(self):
+        self._album_manager.model.remove_filter('nay')
+
+        if self._reconcile_model:
+            # bring the albums from the catalog up to date in the background
+            query_model = self._reconcile_model
+            self._reconcile_model = None
+
+            self._reconcile(iter(query_model), model=query_model,
+                            locations=set())
+        else:
+            self._loaded = True
+            self.save_catalog()
+
+
+class CoverSearchMisses(object):
+    '''
+    Persistent record of the covers searched without success, so they aren't
+    searched again until some time has passed.
+
+    :param filename: `str` path of the file where the misses are kept.
+    :param ttl: `int` seconds a miss is remembered.
+    '''
+
+    def __init__(self, filename, ttl=COVER_SEARCH_MISS_TTL):
+        self.filename = filename
+        self.ttl = ttl
+
+        # key -> time of the search
+        self._misses = None
+        self._changed = False
+
+    def _load(self):
+        if self._misses is not None:
+            return
+
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as misses_file:
+                self._misses = json.load(misses_file)
+        except (IOError, ValueError):
+            self._misses = {}
+
+    def __contains__(self, key):
+        self._load()
+
+        searched = self._misses.get(key)
+
+        return searched is not None and time.time() - searched < self.ttl
+
+    def add(self, key):
+        '''
+        Records that a search for the cover of the key failed.
+        '''
+        self._load()
+
+        self._misses[key] = time.time()
+        self._changed = True
+
+    def discard(self, key):
+        '''
+        Forgets a previous failed search for the cover of the key.
+        '''
+        self._load()
+
+        if self._misses.pop(key, None) is not None:
+            self._changed = True
+
+    def save(self):
         '''
-        Loads and creates `Track` instances for all entries on query_model,
-        assigning them into their correspondant `Album`.
+        Writes the misses, dropping the expired ones.
         '''
-        print("CoverArtBrowser DEBUG - load_albums")
+        if not self._changed:
+            return
 
-        self._load_albums(iter(query_model), albums={}, model=query_model,
-                          total=len(query_model), progress=0.)
+        oldest = time.time() - self.ttl
+        misses = {key: searched for key, searched in self._misses.items()
+                  if searched >= oldest}
 
-        print("CoverArtBrowser DEBUG - load_albums finished")
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
 
-    def do_albums_load_finished(self, albums):
-        # load the albums to the model
-        self._album_manager.model.replace_filter('nay')
-        self._load_model(iter(list(albums.values())), total=len(albums), progress=0.)
+            temp_filename = self.filename + '.tmp'
 
-    def do_model_load_finished(self):
-        self._album_manager.model.remove_filter('nay')
+            with open(temp_filename, 'w', encoding='utf-8') as misses_file:
+                json.dump(misses, misses_file)
+
+            os.replace(temp_filename, self.filename)
+        except (IOError, OSError) as e:
+            print('Error while saving the cover search misses: ' + str(e))
+            return
+
+        self._misses = misses
+        self._changed = False
 
 
 class CoverRequester(GObject.Object):
-    def __init__(self, cover_db):
+    '''
+    Searches the covers of the queued objects with a cover database. Several
+    searches run at once, but they're started at a limited rate to not
+    overload the providers. When the whole queue is replaced, the objects
+    which cover couldn't be found recently are skipped; the objects added
+    explicitly are always searched.
+    The queue may be reordered and its objects cancelled while the searches
+    run; the callback is informed of each object searched along with the
+    progress of the whole queue.
+    Only `request` is used from the cover database, so anything providing it
+    like `RB.ExtDB.request` can be used.
+
+    :param cover_db: `RB.ExtDB` used to search the covers.
+    :param misses: `CoverSearchMisses` to keep the failed searches, if any.
+    :param concurrency: `int` maximum searches running at once.
+    :param rate: `float` searches started per second.
+    :param timeout: `int` seconds after which a search is given up.
+    '''
+
+    def __init__(self, cover_db, misses=None,
+                 concurrency=COVER_SEARCH_CONCURRENCY, rate=COVER_SEARCH_RATE,
+                 timeout=COVER_SEARCH_TIMEOUT):
         super(CoverRequester, self).__init__()
 
         self._cover_db = cover_db
+        self._misses = misses
+        self._concurrency = concurrency
+        self._rate = RateLimiter(rate, concurrency)
+        self._timeout = timeout
+
         self.unknown_cover = None
         self._callback = None
-        self._queue = []
-        self._queue_id = 0
+        self._queue = RequestQueue()
+        # objects taken from the queue and total of objects queued since the
+        # requester started
+        self._done = 0
+        self._total = 0
+        # request id -> (coverobject, key, timeout id)
+        self._active = {}
+        self._request_id = 0
+        self._pump_id = None
         self._running = False
-        self._stop = False
 
     def add_to_queue(self, coverobjects, callback):
-        ''' Adds coverobjects to the queue if they're not already there. '''
-        self._queue.extend(
-            [coverobject for coverobject in coverobjects if coverobject not in self._queue])
+        '''
+        Adds coverobjects to the front of the queue, in the given order, so
+        they're searched next. Those already queued are moved to the front.
+        They're searched even if their covers weren't found recently.
+        '''
+        self._reset_progress()
+
+        for coverobject in reversed(coverobjects):
+            if self._misses is not None:
+                # an explicit request searches the cover again
+                self._misses.discard(
+                    coverobject.create_ext_db_key().to_string())
+
+            if coverobject not in self._queue:
+                self._total += 1
+
+            self._queue.bump(coverobject)
 
         self._start_process(callback)
 
     def replace_queue(self, coverobjects, callback):
         ''' Completely replace the current queue. '''
-        self._queue = coverobjects
+        self._reset_progress()
+
+        self._total -= len(self._queue)
+        self._queue.clear()
+        self._queue.extend(coverobjects)
+        self._total += len(self._queue)
 
         self._start_process(callback)
 
+    def prioritize(self, coverobjects):
+        '''
+        Moves the given coverobjects to the front of the queue, in the given
+        order, if they're queued.
+        '''
+        for coverobject in reversed(coverobjects):
+            if coverobject in self._queue:
+                self._queue.bump(coverobject)
+
+    def cancel(self, coverobjects):
+        '''
+        Removes the given coverobjects from the queue. Their searches aren't
+        cancelled if they already started.
+        '''
+        for coverobject in coverobjects:
+            if coverobject in self._queue:
+                self._queue.discard(coverobject)
+                self._total -= 1
+
+        if self._running:
+            self._process_queue()
+
+    def _reset_progress(self):
+        if not self._running:
+            self._done = 0
+            self._total = len(self._queue)
+
     def _start_process(self, callback):
         ''' Starts the queue processing if it isn't running already '''
         if not self._running:
@@ -1341,66 +2654,326 @@ class CoverRequester(GObject.Object):
     def _process_queue(self):
         '''
         Main method that process the queue.
-        First, it tries to adquire a lock on the queue, and if it can, pops
-        the next element of the queue and process it.
-        The lock makes sure that only one request is done at a time, and
-        successfully ignores false timeouts or strand callbacks.
+        It starts searches for the next elements of the queue while there is
+        room for them and the rate limit allows it. Once the queue is empty and
+        all the searches finished, the requester is stopped.
         '''
-        # process the next element in the queue
-        while self._queue:
-            coverobject = self._queue.pop(0)
+        while self._queue and len(self._active) < self._concurrency:
+            coverobject = self._queue.peek()
+
+            if coverobject.cover is not self.unknown_cover:
+                # it already has a cover
+                self._queue.pop()
+                self._done += 1
+                continue
+
+            key = coverobject.create_ext_db_key()
+
+            if self._misses is not None and key.to_string() in self._misses:
+                # it wasn't found recently
+                self._queue.pop()
+                self._done += 1
+                continue
 
-            if coverobject.cover is self.unknown_cover:
+            if self._pump_id:
+                # already waiting for the rate limit
                 break
-        else:
-            coverobject = None
 
-        if coverobject:
-            # inform the current coverobject being searched
-            self._callback(coverobject)
+            delay = self._rate.acquire()
+
+            if delay:
+                # wait until another search can be started
+                self._pump_id = GLib.timeout_add(int(delay * 1000) + 1,
+                                                 self._on_pump_timeout)
+                break
 
-            # start the request
-            self._queue_id += 1
-            self._search_for_cover(coverobject, self._queue_id)
+            self._queue.pop()
+            self._done += 1
+            self._search_for_cover(coverobject, key)
 
-            # add a timeout to the request
-            Gdk.threads_add_timeout_seconds(GLib.PRIORITY_DEFAULT_IDLE, 40,
-                                            self._next, self._queue_id)
-        else:
+        if self._running and not self._queue and not self._active:
             # if there're no more elements, clean the state of the requester
+            if self._misses is not None:
+                self._misses.save()
+
             self._running = False
             self._callback(None)
 
-    def _search_for_cover(self, coverobject, search_id):
+    def _on_pump_timeout(self):
+        self._pump_id = None
+        self._process_queue()
+
+        return False
+
+    def _search_for_cover(self, coverobject, key):
         '''
-        Actively requests a cover to the cover_db, calling
-        the callback given once the process finishes (since it generally is
-        asynchronous).
+        Actively requests a cover to the cover_db. The request is finished
+        when the cover_db calls back (since it generally is asynchronous) or
+        the timeout expires.
         For more information on the callback arguments, check
         `RB.ExtDB.request` documentation.
 
         :param coverobject: covertype for which search the cover.
+        :param key: `RB.ExtDBKey` of the cover.
         '''
-        # create a key and request the cover
-        key = coverobject.create_ext_db_key()
-        provides = self._cover_db.request(key, self._next, search_id)
-
-        if not provides:
-            # in case there is no provider, call the callback immediately
-            self._next(search_id)
-
-    def _next(self, *args):
-        ''' Advances to the next coverobject to process. '''
-        # get the id of the search
-        search_id = args[-1]
-        if search_id == self._queue_id:
-            # only process the next element if the search_id is the same as
-            # the current id. Otherwise, this is a invalid call
+        # inform the current coverobject being searched and the progress
+        self._callback(coverobject, self._done, self._total)
+
+        self._request_id += 1
+        request_id = self._request_id
+
+        # add a timeout to the request
+        timeout_id = Gdk.threads_add_timeout_seconds(
+            GLib.PRIORITY_DEFAULT_IDLE, self._timeout, self._request_timeout,
+            request_id)
+        self._active[request_id] = (coverobject, key, timeout_id)
+
+        try:
+            provides = self._cover_db.request(key, self._request_finished,
+                                              request_id)
+        except Exception as e:
+            print('Error while requesting a cover: ' + str(e))
+            provides = False
+
+        if not provides and request_id in self._active:
+            # in case there is no provider, finish the request right away,
+            # without considering it a miss
+            self._finish_request(request_id)
+            self._process_queue()
+
+    def _request_finished(self, *args):
+        ''' Callback called by the cover_db once a search finishes. '''
+        # the id of the search is the user data and, before the data, comes
+        # the file where the cover was stored (None if it wasn't found)
+        request_id = args[-1]
+        filename = args[-3]
+
+        request = self._finish_request(request_id)
+
+        if request:
+            coverobject, key = request
+
+            if self._misses is not None:
+                if filename:
+                    self._misses.discard(key.to_string())
+                else:
+                    self._misses.add(key.to_string())
+
+            self._process_queue()
+
+        return False
+
+    def _request_timeout(self, request_id):
+        ''' Gives up a search that is taking too long. '''
+        if self._active.pop(request_id, None):
             self._process_queue()
 
+        return False
+
+    def _finish_request(self, request_id):
+        '''
+        Removes a request from the active ones, returning its coverobject and
+        key (or None if it was already finished).
+        '''
+        request = self._active.pop(request_id, None)
+
+        if not request:
+            # it timed out already
+            return None
+
+        coverobject, key, timeout_id = request
+        GLib.source_remove(timeout_id)
+
+        return coverobject, key
+
     def stop(self):
         ''' Clears the queue, forcing the requester to stop. '''
-        del self._queue[:]
+        self._total -= len(self._queue)
+        self._queue.clear()
+
+
+class CoverLoadQueue(object):
+    '''
+    Iterator over the objects whose covers are waiting to be loaded. It
+    yields first the objects given to `prioritize` (e.g. the ones shown on the
+    viewport) and then the rest in their original order.
+
+    :param coverobjects: iterable of objects with a cover to load.
+    '''
+
+    def __init__(self, coverobjects):
+        self._pending = set(coverobjects)
+        self._rest = iter(coverobjects)
+        self._urgent = collections.deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self._urgent:
+            coverobject = self._urgent.popleft()
+
+            if coverobject in self._pending:
+                self._pending.discard(coverobject)
+                return coverobject
+
+        for coverobject in self._rest:
+            if coverobject in self._pending:
+                self._pending.discard(coverobject)
+                return coverobject
+
+        raise StopIteration
+
+    def __len__(self):
+        return len(self._pending)
+
+    def prioritize(self, coverobjects):
+        '''
+        Makes the given objects the next ones to be yielded, in the given
+        order. It replaces any previous prioritization.
+        '''
+        self._urgent = collections.deque(
+            coverobject for coverobject in coverobjects
+            if coverobject in self._pending)
+
+
+class CoverResidency(object):
+    '''
+    Keeps the pixbufs of the covers within a memory budget. The covers are
+    kept in least recently used order and, when the budget is exceeded, the
+    oldest ones not being shown are unloaded. A cover that is shown again is
+    loaded back (from the thumbnail cache).
+    A cover may be shared by several objects; it's kept track of while any
+    of them uses it.
+
+    :param budget: `int` bytes the covers' pixbufs may use.
+    :param reload: callable that loads back an unloaded cover, and touches
+        it once loaded. By default the cover is loaded right away.
+    '''
+
+    def __init__(self, budget, reload=None):
+        self.budget = budget
+        self.unknown_cover = None
+        self._reload = reload
+
+        # cover -> number of objects using it
+        self._users = collections.Counter()
+        # cover -> bytes, the least recently used first
+        self._resident = collections.OrderedDict()
+        self._shown = set()
+
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        requests = self.hits + self.misses
+
+        return {'covers': len(self._users),
+                'resident': len(self._resident),
+                'resident_bytes': self.resident_bytes,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 1.,
+                'evictions': self.evictions}
+
+    def acquire(self, cover):
+        '''
+        Registers a new user of a cover, making it the most recently used one
+        and unloading others if the budget is exceeded.
+        '''
+        if cover is None or cover is self.unknown_cover:
+            return
+
+        self._users[cover] += 1
+        self.touch(cover)
+        self.trim()
+
+    def release(self, cover):
+        '''
+        Unregisters a user of a cover. Once it has none, the cover isn't kept
+        track of anymore.
+        '''
+        if cover not in self._users:
+            return
+
+        self._users[cover] -= 1
+
+        if not self._users[cover]:
+            del self._users[cover]
+            self._forget(cover)
+
+    def touch(self, cover):
+        '''
+        Makes a cover the most recently used one, updating the memory it
+        uses (e.g. after being resized).
+        '''
+        self._forget(cover)
+
+        if cover not in self._users or not cover.resident:
+            return
+
+        size = cover.nbytes
+
+        self._resident[cover] = size
+        self.resident_bytes += size
+
+    def _forget(self, cover):
+        if cover in self._resident:
+            self.resident_bytes -= self._resident.pop(cover)
+
+    @property
+    def shown(self):
+        '''
+        Covers being shown, as `set`.
+        '''
+        return self._shown
+
+    def show(self, coverobjects):
+        '''
+        Indicates the objects which covers are being shown. Those covers are
+        never unloaded, and are loaded back if they were.
+        '''
+        shown = collections.OrderedDict(
+            (coverobject.cover, None) for coverobject in coverobjects
+            if coverobject.cover in self._users)
+        self._shown = set(shown)
+
+        for cover in shown:
+            if cover.resident:
+                self.hits += 1
+                self.touch(cover)
+            else:
+                self.misses += 1
+
+                if self._reload:
+                    self._reload(cover)
+                else:
+                    cover.load()
+                    self.touch(cover)
+
+        self.trim()
+
+    def trim(self):
+        '''
+        Unloads the least recently used covers until the budget is met.
+        '''
+        if self.resident_bytes <= self.budget:
+            return
+
+        for cover in list(self._resident):
+            if self.resident_bytes <= self.budget:
+                break
+
+            if cover in self._shown:
+                continue
+
+            self._forget(cover)
+            cover.unload(self.unknown_cover.pixbuf)
+            self.evictions += 1
 
 
 class CoverManager(GObject.Object):
@@ -1420,52 +2993,352 @@ class CoverManager(GObject.Object):
     # properties
     has_finished_loading = False
     force_lastfm_check = False
+    # name of the cover database, to be defined by inherited class
+    cover_db_name = None
     cover_size = GObject.property(type=int, default=0)
+    cover_workers = GObject.property(type=int, default=2)
+    cover_memory = GObject.property(type=int, default=256)
+    cover_storage_size = GObject.property(type=int, default=1024)
 
     def __init__(self, plugin, manager):
         super(CoverManager, self).__init__()
         # self.cover_db = None to be defined by inherited class
         self._manager = manager
-        self._requester = CoverRequester(self.cover_db)
+        self._requester = CoverRequester(self.cover_db, CoverSearchMisses(
+            os.path.join(RB.user_cache_dir(), 'coverart_browser',
+                         'misses-%s.json' % self.cover_db_name)))
 
         self.unknown_cover = None  #to be defined by inherited class
         self.album_manager = None  #to be defined by inherited class
 
+        # covers decoding: the pool is created when needed; the covers decoded
+        # by the workers are delivered to the main loop in batches, and the
+        # ones from an outdated generation are discarded
+        self._decode_pool = None
+        # covers which larger levels are being decoded
+        self._refining = set()
+        self._decoded = []
+        self._decoded_lock = threading.Lock()
+        self._delivery_id = None
+        self._generation = 0
+        self._in_flight = 0
+
+        # covers waiting to be loaded, in priority order
+        self._loading = None
+        self._cover_queue = None
+        self._cover_locations = {}
+        self._pump_id = None
+
+        # keeps the covers' pixbufs within the memory budget (in MB)
+        self.residency = CoverResidency(self.cover_memory * 1024 * 1024,
+                                        self._refine_cover)
+
+        # identity of an image -> cover created for it, so identical images
+        # share a single cover
+        self._covers = weakref.WeakValueDictionary()
+
         # connect the signal to update cover arts when added
         self.req_id = self.cover_db.connect('added',
                                             self.coverart_added_callback)
         self.connect('load-finished', self._on_load_finished)
+        self.connect('notify::cover-workers', self._on_cover_workers_changed)
+        self.connect('notify::cover-memory', self._on_cover_memory_changed)
 
     def _on_load_finished(self, *args):
         self.has_finished_loading = True
 
-    @idle_iterator
-    def _load_covers(self):
-        def process(coverobject, data):
-            self.load_cover(coverobject)
+    def _on_cover_memory_changed(self, *args):
+        self.residency.budget = self.cover_memory * 1024 * 1024
+        self.residency.trim()
 
-        def finish(data):
+    def _on_cover_workers_changed(self, *args):
+        # the pool is recreated with the new number of workers when needed
+        if self._decode_pool:
+            self._decode_pool.shutdown(wait=False)
+            self._decode_pool = None
+
+    def _schedule_pump(self):
+        if not self._pump_id:
+            self._pump_id = Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE,
+                                                 self._pump_covers, None)
+
+    def _pump_covers(self, *args):
+        '''
+        Takes covers from the queue, in priority order, while there's room for
+        them on the workers pool. Only a few covers are kept decoding at a
+        time, so a change of priorities takes effect right away.
+        '''
+        self._pump_id = None
+        deadline = time.perf_counter() + IDLE_TIME_BUDGET
+        max_in_flight = max(1, self.cover_workers) * 2
+
+        while self._cover_queue is not None and \
+                self._in_flight < max_in_flight:
+            coverobject = next(self._cover_queue, None)
+
+            if coverobject is None:
+                self._cover_queue = None
+                self._cover_locations = {}
+                self._loading['resolved'] = True
+                self._check_load_finished()
+                break
+
+            try:
+                self.load_cover(coverobject,
+                                self._cover_locations.get(coverobject))
+            except Exception as e:
+                print('Error while loading covers: ' + str(e))
+
+                self._loading['done'] += 1
+
+            if time.perf_counter() > deadline:
+                # give the control back to the main loop
+                if self._in_flight < max_in_flight:
+                    self._schedule_pump()
+                break
+
+        if self._loading and self._loading['total']:
+            self.album_manager.progress = \
+                self._loading['done'] / self._loading['total']
+
+        return False
+
+    def show_covers(self, coverobjects):
+        '''
+        Indicates the objects which covers are being (or about to be) shown.
+        Their covers are the next ones to be loaded, in the given order, and
+        are kept in memory while they're shown.
+
+        :param coverobjects: `list` of objects which covers are shown.
+        '''
+        if self._cover_queue is not None:
+            self._cover_queue.prioritize(coverobjects)
+
+        # search the shown covers first too
+        self._requester.prioritize(coverobjects)
+
+        self.residency.show(coverobjects)
+
+    def _set_cover(self, coverobject, cover):
+        self.residency.release(coverobject.cover)
+        coverobject.cover = cover
+        self.residency.acquire(cover)
+
+    def _intern_cover(self, identity, image, levels=None):
+        '''
+        Returns the cover for an image, reusing the one already created for
+        an identical image if there is one.
+
+        :param identity: `str` identifying the contents of the image.
+        :param image: `str` path of the image.
+        :param levels: `list` of `GdkPixbuf.Pixbuf` already created from the
+            image, if any.
+        '''
+        cover = self._covers.get(identity)
+
+        if cover is None:
+            cover = self.create_cover(image, levels)
+            self._covers[identity] = cover
+        else:
+            cover.resize(self.cover_size)
+
+        return cover
+
+    def _cover_identity(self, art_location):
+        '''
+        Returns what identifies the contents of an image: their digest or, if
+        they can't be read, the canonical path of the image.
+        '''
+        return ThumbnailCache.get_default().get_digest(art_location) or \
+            os.path.realpath(art_location)
+
+    def _check_load_finished(self):
+        loading = self._loading
+
+        if loading['total']:
+            self.album_manager.progress = loading['done'] / loading['total']
+
+        if loading['resolved'] and loading['done'] >= loading['total']:
+            self._loading = None
             self.album_manager.progress = 1
             gc.collect()
             self.emit('load-finished')
 
-        def error(exception):
-            print('Error while loading covers: ' + str(exception))
+    def _get_decode_pool(self):
+        if not self._decode_pool:
+            self._decode_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, self.cover_workers))
 
-        def after(data):
-            data['progress'] += COVER_LOAD_CHUNK
+        return self._decode_pool
 
-            # update the progress
-            self.album_manager.progress = data['progress'] / data['total']
+    def _decode_cover(self, coverobject, art_location, replace=False):
+        '''
+        Queues the decoding of a cover on the workers pool.
 
-        return COVER_LOAD_CHUNK, process, after, error, finish
+        :param replace: `bool` whether the image may have been replaced, so
+            the cover created for it before mustn't be shared.
+        '''
+        self._in_flight += 1
+        self._get_decode_pool().submit(self._decode_worker, self._generation,
+                                       coverobject, art_location,
+                                       self.cover_size, replace)
+
+    def _decode_worker(self, generation, coverobject, art_location, size,
+                       replace):
+        # NOTE: this runs on a worker thread
+        if generation != self._generation:
+            return
+
+        identity = self._cover_identity(art_location)
+        levels = None
+
+        # an identical image doesn't need to be decoded again
+        if replace or identity not in self._covers:
+            try:
+                levels = Cover.create_levels(art_location, size)
+            except Exception as e:
+                print('Error while decoding a cover: ' + str(e))
+                identity = None
+
+        with self._decoded_lock:
+            self._decoded.append((generation, coverobject, art_location,
+                                  identity, levels, replace))
+
+            if not self._delivery_id:
+                self._delivery_id = Gdk.threads_add_idle(
+                    GLib.PRIORITY_DEFAULT_IDLE, self._deliver_covers, None)
+
+    def _deliver_covers(self, *args):
+        with self._decoded_lock:
+            decoded = self._decoded
+            self._decoded = []
+            self._delivery_id = None
+
+        for generation, coverobject, art_location, identity, levels, replace \
+                in decoded:
+            if generation != self._generation:
+                continue
+
+            self._in_flight -= 1
+
+            if replace:
+                # a replaced cover doesn't count towards the loading, and if
+                # it couldn't be decoded the current one is kept
+                if identity:
+                    self._covers.pop(identity, None)
+                    self._set_cover(coverobject, self._intern_cover(
+                        identity, art_location, levels))
+
+                continue
+
+            if not identity:
+                self._set_cover(coverobject, self.unknown_cover)
+            else:
+                # if the size changed while the cover was being decoded, it's
+                # created from the levels anyway
+                cover = self._intern_cover(identity, art_location, levels)
+                self._set_cover(coverobject, cover)
+
+                if not cover.sharp:
+                    self._refine_cover(cover)
+
+            if self._loading:
+                self._loading['done'] += 1
+
+        if self._loading:
+            self._check_load_finished()
+
+        if self._cover_queue is not None:
+            # make room for more covers
+            self._pump_covers()
+
+        return False
+
+    def resize_cover(self, cover):
+        '''
+        Resizes a cover to the current size. If its levels are too small, it's
+        enlarged meanwhile and decoded again at a larger size.
+        '''
+        cover.resize(self.cover_size)
+        self.residency.touch(cover)
+
+        if not cover.sharp:
+            self._refine_cover(cover)
+
+    def _refine_cover(self, cover):
+        '''
+        Queues the decoding of the levels of a cover on the workers pool,
+        either because they're too small or because the cover was unloaded.
+        '''
+        if cover in self._refining:
+            return
+
+        self._refining.add(cover)
+        self._get_decode_pool().submit(self._refine_worker, self._generation,
+                                       cover, self.cover_size)
+
+    def _refine_worker(self, generation, cover, size):
+        # NOTE: this runs on a worker thread
+        if generation != self._generation:
+            return
+
+        try:
+            levels = Cover.create_levels(cover.original, size)
+        except Exception as e:
+            print('Error while decoding a cover: ' + str(e))
+            levels = None
+
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self._deliver_refined,
+                             (generation, cover, levels))
+
+    def _deliver_refined(self, data):
+        generation, cover, levels = data
+
+        self._refining.discard(cover)
+
+        if generation == self._generation and levels:
+            # this also loads back a cover that was unloaded
+            cover.set_levels(levels)
+            cover.emit('resized')
+
+            self.residency.touch(cover)
+            self.residency.trim()
+
+            if not cover.sharp:
+                # it was enlarged again meanwhile
+                self._refine_cover(cover)
+
+        return False
+
+    def cancel_cover_loading(self):
+        '''
+        Cancels the covers being loaded. The covers already queued for
+        decoding are discarded.
+        '''
+        self._generation += 1
+        self._refining = set()
+        self._in_flight = 0
+        self._loading = None
+        self._cover_queue = None
+        self._cover_locations = {}
+
+    def shutdown(self):
+        '''
+        Cancels any cover loading and stops the decoding workers.
+        '''
+        self.cancel_cover_loading()
+
+        if self._decode_pool:
+            self._decode_pool.shutdown(wait=False)
+            self._decode_pool = None
 
     def create_unknown_cover(self, plugin):
         # set the unknown cover to the requester to make comparisons
         self._requester.unknown_cover = self.unknown_cover
+        self.residency.unknown_cover = self.unknown_cover
 
-    def create_cover(self, image):
-        return Cover(self.cover_size, image)
+    def create_cover(self, image, levels=None):
+        return Cover(self.cover_size, image, levels)
 
     def coverart_added_callback(self, ext_db, key, path, pixbuf):
         # use the name to get the album and update it's cover
@@ -1473,20 +3346,30 @@ class CoverManager(GObject.Object):
             coverobject = self._manager.model.get_from_ext_db_key(key)
 
             if coverobject:
-                coverobject.cover = self.create_cover(path)
+                # the image may have been replaced, so don't share the cover
+                # that was created for it before; its digest is computed on
+                # the workers, along with the decoding
+                self._decode_cover(coverobject, path, replace=True)
 
-    def load_cover(self, coverobject):
+    def load_cover(self, coverobject, art_location=None):
         '''
         Tries to load an Album's cover. If no cover is found upon lookup,
         the unknown cover is used.
         This method doesn't actively tries to find a cover, for that you should
         use the search_cover method.
 
+        The location of the cover is resolved right away, but the image is
+        decoded on a worker thread and the cover is set once it's ready.
+
         :param album: `Album` for which load the cover.
+        :param art_location: `str` location of the cover, if it's already
+            known. If the file doesn't exist anymore, the cover is looked up.
         '''
-        # create a key and look for the art location
-        key = coverobject.create_ext_db_key()
-        art_location = self.cover_db.lookup(key)
+        if not art_location or not os.path.exists(art_location):
+            # create a key and look for the art location
+            # NOTE: the ExtDB isn't thread safe, so this is done here
+            key = coverobject.create_ext_db_key()
+            art_location = self.cover_db.lookup(key)
 
         if art_location and not isinstance(art_location, str):
             # RB 3.2 returns a tuple (path, key)
@@ -1494,26 +3377,50 @@ class CoverManager(GObject.Object):
 
         # try to create a cover
         if art_location:
-            coverobject.cover = self.create_cover(art_location)
+            self._decode_cover(coverobject, art_location)
         else:
-            coverobject.cover = self.unknown_cover
+            self._set_cover(coverobject, self.unknown_cover)
 
-    def load_covers(self):
+            if self._loading:
+                self._loading['done'] += 1
+
+    def load_covers(self, locations=None):
         '''
         Loads all the covers for the model's albums.
+
+        :param locations: `dict` with the already known locations of some of
+            the covers, to avoid looking them up.
         '''
+        # forget about any previous load
+        self.cancel_cover_loading()
+
+        # the covers are all created again
+        self._covers.clear()
+
         # get all the coverobjects
         coverobjects = self._manager.model.get_all()
 
-        self._load_covers(iter(coverobjects), total=len(coverobjects), progress=0.)
+        # make room on the thumbnails cache for all the covers
+        level_size = Cover.level_size(self.cover_size)
+        ThumbnailCache.get_default().reserve(self.cover_db_name,
+                                             len(coverobjects), level_size,
+                                             level_size)
+
+        self._loading = {'total': len(coverobjects), 'done': 0,
+                         'resolved': False}
+        self._cover_queue = CoverLoadQueue(coverobjects)
+        self._cover_locations = locations or {}
+        self._schedule_pump()
 
     def search_covers(self, coverobjects=None, callback=lambda *_: None):
         '''
-        Request all the albums' covers, one by one, periodically calling a
-        callback to inform the status of the process.
-        The callback should accept one argument: the album which cover is
-        being requested. When the argument passed is None, it means the
-        process has finished.
+        Request all the albums' covers, periodically calling a callback to
+        inform the status of the process.
+        The callback should accept three arguments: the album which cover is
+        being requested, the number of albums already processed and the total
+        of albums to process. When the album passed is None (and the other
+        arguments are omitted), it means the process has finished.
+        The given albums are searched before any other queued album.
 
         :param albums: `list` of `Album` for which look for covers.
         :param callback: `callable` to periodically inform when an album's
@@ -1538,11 +3445,17 @@ class CoverManager(GObject.Object):
         else:
             self._requester.add_to_queue(coverobjects, callback)
 
-    def cancel_cover_request(self):
+    def cancel_cover_request(self, coverobjects=None):
         '''
         Cancel the current cover request, if there is one running.
+
+        :param coverobjects: `list` of objects which searches to cancel, or
+            None to cancel all of them.
         '''
-        self._requester.stop()
+        if coverobjects is None:
+            self._requester.stop()
+        else:
+            self._requester.cancel(coverobjects)
 
     def update_pixbuf_cover(self, coverobject, pixbuf):
         pass
@@ -1553,7 +3466,9 @@ class CoverManager(GObject.Object):
         all the entries on the album.
         In the case a uri is given instead of the pixbuf, it will first try to
         retrieve an image from the uri, then recall this method with the
-        obtained pixbuf.
+        obtained pixbuf. Remote images are downloaded on a separate thread and
+        decoded while they arrive. Images larger than the storage size are
+        scaled down while they're decoded; smaller ones are kept as they are.
 
         :param album: `Album` for which the cover is.
         :param pixbuf: `GkdPixbuf.Pixbuf` to use as a cover.
@@ -1569,48 +3484,51 @@ class CoverManager(GObject.Object):
                 path = rb3compat.url2pathname(uri.strip()).replace('file://', '')
 
                 if os.path.exists(path):
-                    cover = GdkPixbuf.Pixbuf.new_from_file(path)
-                    self.update_cover(coverobject, cover)
+                    cover = load_pixbuf(path, self.cover_storage_size)
+
+                    if cover:
+                        self.update_cover(coverobject, cover)
             else:
                 # assume is a remote uri and we have to retrieve the data
-                def cover_update(data, coverobject):
-                    # save the cover on a temp file and open it as a pixbuf
-                    with tempfile.NamedTemporaryFile(mode='wb') as tmp:
-                        try:
-                            tmp.write(data)
-                            tmp.flush()
-                            cover = GdkPixbuf.Pixbuf.new_from_file(tmp.name)
-
-                            # set the new cover
-                            self.update_cover(coverobject, cover)
-                        except:
-                            print("The URI doesn't point to an image or " + \
-                                  "the image couldn't be opened.")
-
-                asyncLoader = rb.Loader()
-                asyncLoader.get_url(uri, cover_update, coverobject)
+                thread = threading.Thread(target=self._download_cover,
+                                          args=(coverobject, uri))
+                thread.daemon = True
+                thread.start()
+
+    def _download_cover(self, coverobject, uri):
+        # NOTE: this runs on a separate thread
+        pixbuf = download_pixbuf(uri, self.cover_storage_size)
+
+        if pixbuf:
+            # set the new cover
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE,
+                                 self._cover_downloaded, (coverobject, pixbuf))
+        else:
+            print("The URI doesn't point to an image or " + \
+                  "the image couldn't be opened.")
+
+    def _cover_downloaded(self, data):
+        coverobject, pixbuf = data
+        self.update_cover(coverobject, pixbuf)
+
+        return False
 
 class AlbumCoverManager(CoverManager):
-    # properties
-    add_shadow = GObject.property(type=bool, default=False)
-    shadow_image = GObject.property(type=str, default="above")
+    cover_db_name = 'album-art'
 
     def __init__(self, plugin, album_manager):
-        self.cover_db = RB.ExtDB(name='album-art')
+        self.cover_db = RB.ExtDB(name=self.cover_db_name)
         super(AlbumCoverManager, self).__init__(plugin, album_manager)
 
         self.album_manager = album_manager
         self._connect_properties()
         self._connect_signals(plugin)
 
-        # create unknown cover and shadow for covers
+        # create unknown cover
         self.create_unknown_cover(plugin)
 
     def _connect_signals(self, plugin):
         self.connect('notify::cover-size', self._on_cover_size_changed)
-        self.connect('notify::add-shadow', self._on_add_shadow_changed, plugin)
-        self.connect('notify::shadow-image', self._on_add_shadow_changed,
-                     plugin)
 
     def _connect_properties(self):
         gs = GSetting()
@@ -1618,50 +3536,38 @@ class AlbumCoverManager(CoverManager):
 
         setting.bind(gs.PluginKey.COVER_SIZE, self, 'cover_size',
                      Gio.SettingsBindFlags.GET)
-        setting.bind(gs.PluginKey.ADD_SHADOW, self, 'add_shadow',
+        setting.bind(gs.PluginKey.COVER_WORKERS, self, 'cover_workers',
                      Gio.SettingsBindFlags.GET)
-        setting.bind(gs.PluginKey.SHADOW_IMAGE, self, 'shadow_image',
+        setting.bind(gs.PluginKey.COVER_MEMORY, self, 'cover_memory',
                      Gio.SettingsBindFlags.GET)
+        setting.bind(gs.PluginKey.COVER_STORAGE_SIZE, self,
+                     'cover_storage_size', Gio.SettingsBindFlags.GET)
 
     def create_unknown_cover(self, plugin):
         # create the unknown cover
-        self._shadow = Shadow(self.cover_size,
-                              rb.find_plugin_file(plugin, 'img/album-shadow-%s.png' %
-                                                  self.shadow_image))
+        # NOTE: the shadow isn't part of the covers, the views draw it
         self.unknown_cover = self.create_cover(
             rb.find_plugin_file(plugin, 'img/rhythmbox-missing-artwork.svg'))
 
         super(AlbumCoverManager, self).create_unknown_cover(plugin)
 
-    def create_cover(self, image):
-        if self.add_shadow:
-            cover = ShadowedCover(self._shadow, image)
-        else:
-            cover = Cover(self.cover_size, image)
-
-        return cover
-
-    def _on_add_shadow_changed(self, obj, prop, plugin):
-        # update the unknown_cover
-        self.create_unknown_cover(plugin)
-
-        # recreate all the covers
-        self.load_covers()
-
     def _on_cover_size_changed(self, *args):
         '''
         Updates the showing albums cover size.
         '''
-        # update the shadow
-        self._shadow.resize(self.cover_size)
-
         # update coverview item width
         self.update_item_width()
 
-        # update the album's covers
+        # resize the covers being shown right away, from their levels
+        self.resize_cover(self.unknown_cover)
+
+        for cover in list(self.residency.shown):
+            self.resize_cover(cover)
+
+        # update the rest of the album's covers
         albums = self.album_manager.model.get_all()
 
-        self._resize_covers(iter(albums), total=len(albums), progress=0.)
+        self._resize_covers(iter(albums), total=len(albums))
 
     def update_item_width(self):
         self.album_manager.current_view.resize_icon(self.cover_size)
@@ -1684,7 +3590,9 @@ class AlbumCoverManager(CoverManager):
     @idle_iterator
     def _resize_covers(self):
         def process(coverobject, data):
-            coverobject.cover.resize(self.cover_size)
+            # a cover shared by several objects is only resized once
+            if coverobject.cover.size != self.cover_size:
+                self.resize_cover(coverobject.cover)
 
         def finish(data):
             self.album_manager.progress = 1
@@ -1694,10 +3602,8 @@ class AlbumCoverManager(CoverManager):
             print("Error while resizing covers: " + str(exception))
 
         def after(data):
-            data['progress'] += COVER_LOAD_CHUNK
-
             # update the progress
-            self.album_manager.progress = data['progress'] / data['total']
+            self.album_manager.progress = data['processed'] / data['total']
 
         return COVER_LOAD_CHUNK, process, after, error, finish
 
@@ -1825,6 +3731,7 @@ class AlbumManager(GObject.Object):
         super(AlbumManager, self).__init__()
 
         self.current_view = current_view
+        self.plugin = plugin
         self.db = plugin.shell.props.db
 
         self.model = AlbumsModel()
@@ -1832,10 +3739,11 @@ class AlbumManager(GObject.Object):
         # initialize managers
         self.loader = AlbumLoader(self)
         self.cover_man = AlbumCoverManager(plugin, self)
-        from coverart_artistview import ArtistManager
-
-        self.artist_man = ArtistManager(plugin, self, plugin.shell)
         self.text_man = TextManager(self)
+
+        # the artists are only loaded when the artist view is first used
+        self._artist_man = None
+        self._albums_loaded = False
         self._show_policy = current_view.show_policy.initialise(self)
 
         # connect signals
@@ -1856,6 +3764,37 @@ class AlbumManager(GObject.Object):
         if not toolbar_type or toolbar_type == "album":
             self.model.sort()
 
+    @property
+    def artist_man(self):
+        '''
+        `ArtistManager` for the artists of the albums. It's created the first
+        time it's requested, so the artists and their covers aren't loaded
+        until they're needed.
+        '''
+        if not self._artist_man:
+            from coverart_artistview import ArtistManager
+
+            self._artist_man = ArtistManager(self.plugin, self,
+                                             self.plugin.shell)
+
+            if self._albums_loaded:
+                self._artist_man.loader.load_artists()
+
+        return self._artist_man
+
+    @property
+    def has_artist_man(self):
+        '''
+        Indicates if the `ArtistManager` has already been created.
+        '''
+        return self._artist_man is not None
+
     def _load_finished_callback(self, *args):
-        self.artist_man.loader.load_artists()
-        self.cover_man.load_covers()
+        self._albums_loaded = True
+
+        if self._artist_man:
+            self._artist_man.loader.load_artists()
+
+        # the covers found on the previous session are used only once
+        self.cover_man.load_covers(self.loader.cover_locations)
+        self.loader.cover_locations = {}
@@ -17,6 +17,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301  USA.
 
+import collections
 import os
 import tempfile
 import shutil
@@ -31,7 +32,6 @@ from gi.repository import RB
 
 from coverart_browser_prefs import GSetting
 from coverart_album import Album
-from coverart_album import AlbumsModel
 from coverart_album import CoverManager
 from coverart_widgets import AbstractView
 from coverart_utils import SortedCollection
@@ -40,6 +40,7 @@ from coverart_toolbar import ToolbarObject
 from coverart_utils import idle_iterator
 from coverart_utils import dumpstack
 from coverart_utils import create_pixbuf_from_file_at_size
+from coverart_utils import collation_key
 from coverart_extdb import CoverArtExtDB
 import coverart_rb3compat as rb3compat
 from coverart_rb3compat import Menu
@@ -56,6 +57,13 @@ def create_temporary_copy(path):
 
 ARTIST_LOAD_CHUNK = 50
 
+# album properties used to sort the albums of an artist, for each sort setting
+album_sort_keys = {
+    'name_artist': ('album_sort', 'album_sort'),
+    'year_artist': ('real_year', 'calc_year_sort'),
+    'rating_artist': ('rating', 'album_sort')
+}
+
 
 class Artist(GObject.Object):
     '''
@@ -119,6 +127,7 @@ class ArtistsModel(GObject.Object):
     column 4 -> blank text column to pad the view correctly
     column 5 -> markup containing formatted text
     column 6 -> blank text for the expander column
+    column 7 -> key used to sort the artists, None for the albums
     '''
     # signals
     __gsignals__ = {
@@ -129,7 +138,7 @@ class ArtistsModel(GObject.Object):
     # list of columns names and positions on the TreeModel
     columns = {'tooltip': 0, 'pixbuf': 1,
                'artist_album': 2, 'show': 3,
-               'empty': 4, 'markup': 5, 'expander': 6}
+               'empty': 4, 'markup': 5, 'expander': 6, 'sort_key': 7}
 
     def __init__(self, album_manager):
         super(ArtistsModel, self).__init__()
@@ -137,15 +146,26 @@ class ArtistsModel(GObject.Object):
         self.album_manager = album_manager
         self._iters = {}
         self._albumiters = {}
+
+        # artist name -> albums of the artist, kept in sync with the albums
+        # model so an artist doesn't need to look through all the albums
+        self._artist_albums = {}
+        # artist name -> number of albums of the artist shown on the albums
+        # model; the artist is shown while it has any
+        self._visible_albums = collections.Counter()
         self._artists = SortedCollection(
             key=lambda artist: getattr(artist, 'name'))
 
         self._tree_store = Gtk.TreeStore(str, GdkPixbuf.Pixbuf, object,
-                                         bool, str, str, str)
+                                         bool, str, str, str, str)
 
         # sorting idle call
         self._sort_process = None
 
+        # current album sorting, read from the settings only when they change
+        self._sortkey = {'type': None, 'order': True}
+        self._load_sortkey()
+
         # create the filtered store that's used with the view
         self._filtered_store = self._tree_store.filter_new()
         self._filtered_store.set_visible_column(ArtistsModel.columns['show'])
@@ -158,26 +178,89 @@ class ArtistsModel(GObject.Object):
 
     def _connect_signals(self):
         self.connect('update-path', self._on_update_path)
-        self.album_manager.model.connect('filter-changed', self._on_album_filter_changed)
 
-    def _on_album_filter_changed(self, *args):
-        if len(self._iters) == 0:
+        album_model = self.album_manager.model
+        album_model.connect('album-added', self._on_album_added)
+        album_model.connect('album-removed', self._on_album_removed)
+        album_model.connect('visibility-changed',
+                            self._on_album_visibility_changed)
+
+        # index the albums already loaded
+        for album in album_model.get_all():
+            self._index_album(album)
+
+    def _index_album(self, album):
+        self._artist_albums.setdefault(album.artist, set()).add(album)
+
+        if self.album_manager.model.is_visible(album):
+            self._visible_albums[album.artist] += 1
+
+    def _on_album_added(self, album_model, album):
+        self._index_album(album)
+
+        if album.artist not in self._iters:
             return
 
-        artists = list(set(row[AlbumsModel.columns['album']].artist for row in self.album_manager.model.store))
+        if self._visible_albums[album.artist] == 1:
+            self.show(album.artist, True)
+
+        if 'dummy_iter' not in self._iters[album.artist]:
+            # the artist is already expanded, so add the album to it
+            self.add_album_to_artist(self.get(album.artist), [album])
+
+    def _on_album_removed(self, album_model, album):
+        # the album is hidden before it's removed, so the visible count is
+        # already updated
+        albums = self._artist_albums[album.artist]
+        albums.discard(album)
+
+        self._remove_album(album)
+
+        if not albums:
+            del self._artist_albums[album.artist]
+
+            if album.artist in self._iters:
+                self.remove(self.get(album.artist))
+
+    def _on_album_visibility_changed(self, album_model, shown, hidden):
+        changed = set()
+
+        for album in shown:
+            if album in self._artist_albums.get(album.artist, ()):
+                self._visible_albums[album.artist] += 1
+                changed.add(album.artist)
+
+        for album in hidden:
+            if album in self._artist_albums.get(album.artist, ()):
+                self._visible_albums[album.artist] -= 1
+                changed.add(album.artist)
+
+                if not self._visible_albums[album.artist]:
+                    del self._visible_albums[album.artist]
 
-        for artist in self._iters:
-            self.show(artist, artist in artists)
+        for artist_name in changed:
+            if artist_name in self._iters:
+                self.show(artist_name, self._visible_albums[artist_name] > 0)
 
     def _compare(self, model, row1, row2, user_data):
 
-        if not model.iter_has_child(row1) or \
-                not model.iter_has_child(row2):
-            return 0
+        sort_column = self.columns['sort_key']
+        value1 = model.get_value(row1, sort_column)
+        value2 = model.get_value(row2, sort_column)
+
+        if value1 is None or value2 is None:
+            # albums keep the order they have on the store, whatever the
+            # order of the artists
+            value1 = model.get_path(row1).get_indices()[-1]
+            value2 = model.get_path(row2).get_indices()[-1]
+
+            if self._tree_sort.get_sort_column_id()[1] == \
+                    Gtk.SortType.DESCENDING:
+                value1, value2 = value2, value1
 
-        sort_column = 0
-        value1 = RB.search_fold(model.get_value(row1, sort_column))
-        value2 = RB.search_fold(model.get_value(row2, sort_column))
+            return (value1 > value2) - (value1 < value2)
+
+        # the artists compare by their precomputed keys
         if value1 < value2:
             return -1
         elif value1 == value2:
@@ -249,7 +332,7 @@ class ArtistsModel(GObject.Object):
            called when update-path signal is called
         '''
         artist = self.get_from_path(treepath)
-        albums = self.album_manager.model.get_all()
+        albums = self._artist_albums.get(artist.name, ())
         self.add_album_to_artist(artist, albums)
 
     def add_album_to_artist(self, artist, albums):
@@ -267,7 +350,14 @@ class ArtistsModel(GObject.Object):
         # before and have no need to add albums
 
         if 'dummy_iter' in self._iters[artist.name]:
-            self._iters[artist.name]['album'] = []
+            self._iters[artist.name]['albums'] = \
+                SortedCollection(key=self._album_key)
+            # the dummy row stays first until all the albums are added
+            offset = 1
+        else:
+            offset = 0
+
+        artist_albums = self._iters[artist.name]['albums']
 
         for album in albums:
             if artist.name == album.artist and not (album in self._albumiters):
@@ -275,16 +365,17 @@ class ArtistsModel(GObject.Object):
 
                 # generate necessary values
                 values = self._generate_album_values(album)
-                # insert the values
-                tree_iter = self._tree_store.append(artist_iter, values)
+                # insert the values on its sorted position
+                pos = self._album_position(artist_albums,
+                                           artist_albums.insert(album))
+                tree_iter = self._tree_store.insert(artist_iter, pos + offset,
+                                                    values)
                 self._albumiters[album] = {}
                 self._albumiters[album]['iter'] = tree_iter
-                self._iters[artist.name]['album'].append(tree_iter)
 
                 # connect signals
                 ids = (album.connect('modified', self._album_modified),
-                       album.connect('cover-updated', self._album_coverupdate),
-                       album.connect('emptied', self._album_emptied))
+                       album.connect('cover-updated', self._album_coverupdate))
 
                 self._albumiters[album]['ids'] = ids
 
@@ -292,7 +383,25 @@ class ArtistsModel(GObject.Object):
             self._tree_store.remove(self._iters[artist.name]['dummy_iter'])
             del self._iters[artist.name]['dummy_iter']
 
-        self.sort()  # ensure the added albums are sorted correctly
+    def _album_key(self, album):
+        return [getattr(album, prop)
+                for prop in album_sort_keys[self._sortkey['type']]]
+
+    def _album_position(self, artist_albums, index):
+        '''
+        Returns the position on the store of the album at the given index of
+        the artist's `SortedCollection`, which is always kept ascending.
+        '''
+        if self._sortkey['order']:
+            return index
+
+        return len(artist_albums) - index - 1
+
+    def _album_at(self, artist_albums, pos):
+        if self._sortkey['order']:
+            return artist_albums[pos]
+
+        return artist_albums[len(artist_albums) - pos - 1]
 
     def _album_modified(self, album):
         print("album modified")
@@ -306,31 +415,54 @@ class ArtistsModel(GObject.Object):
         if self._tree_store.iter_is_valid(tree_iter):
             # only update if the iter is valid
             # generate and update values
-            tooltip, pixbuf, album, show, blank, markup, empty = \
+            tooltip, pixbuf, album, show, blank, markup, empty, sort_key = \
                 self._generate_album_values(album)
 
             self._tree_store.set(tree_iter, self.columns['tooltip'], tooltip,
                                  self.columns['markup'], markup, self.columns['show'], show)
 
-            self.sort()  # ensure the added albums are sorted correctly
+            self._reorder_album(album, tree_iter)
 
-    def _album_emptied(self, album):
+    def _reorder_album(self, album, tree_iter):
+        '''
+        Moves the album to its new position between the albums of its artist,
+        if its sorting key changed.
+        '''
+        artist_albums = self._iters[album.artist]['albums']
+        index = artist_albums.reorder(album)
+
+        if index == -1 or len(artist_albums) == 1:
+            return
+
+        pos = self._album_position(artist_albums, index)
+
+        if (pos + 1) >= len(artist_albums):
+            old_album = self._album_at(artist_albums, pos - 1)
+            self._tree_store.move_after(tree_iter,
+                                        self._albumiters[old_album]['iter'])
+        else:
+            old_album = self._album_at(artist_albums, pos + 1)
+            self._tree_store.move_before(tree_iter,
+                                         self._albumiters[old_album]['iter'])
+
+        # the sorted store doesn't follow the moves of the rows while it's
+        # sorted, so ask it to place again just the moved row
+        self._tree_store.row_changed(self._tree_store.get_path(tree_iter),
+                                     tree_iter)
+
+    def _remove_album(self, album):
         '''
         Removes this album from the model.
 
         :param album: `Album` to be removed from the model.
         '''
-        print('album emptied')
-        print(album)
-        print(album.artist)
         if not (album in self._albumiters):
-            print("not found in albumiters")
+            # the artist was never expanded
             return
 
-        artist = self.get(album.artist)
         album_iter = self._albumiters[album]['iter']
 
-        self._iters[album.artist]['album'].remove(album_iter)
+        self._iters[album.artist]['albums'].remove(album)
         self._tree_store.remove(album_iter)
 
         # disconnect signals
@@ -339,23 +471,19 @@ class ArtistsModel(GObject.Object):
 
         del self._albumiters[album]
 
-        # test if there are any more albums for this artist otherwise just cleanup
-        if len(self._iters[album.artist]['album']) == 0:
-            self.remove(artist)
-            self._on_album_filter_changed(_)
-
     def _album_coverupdate(self, album):
-        tooltip, pixbuf, album, show, blank, markup, empty = self._generate_album_values(album)
+        tooltip, pixbuf, album, show, blank, markup, empty, sort_key = \
+            self._generate_album_values(album)
         self._tree_store.set_value(self._albumiters[album]['iter'],
                                    self.columns['pixbuf'], pixbuf)
 
     def _generate_artist_values(self, artist):
         tooltip = artist.name
         pixbuf = artist.cover.pixbuf
-        show = True
+        show = self._visible_albums[artist.name] > 0
 
         return tooltip, pixbuf, artist, show, '', \
-               GLib.markup_escape_text(tooltip), ''
+               GLib.markup_escape_text(tooltip), '', collation_key(artist.name)
 
     def _generate_album_values(self, album):
         tooltip = album.name
@@ -398,7 +526,7 @@ class ArtistsModel(GObject.Object):
                     GLib.markup_escape_text(detail) + \
                     '</small>'
 
-        return tooltip, pixbuf, album, show, '', formatted, ''
+        return tooltip, pixbuf, album, show, '', formatted, '', None
 
     def remove(self, artist):
         '''
@@ -406,11 +534,24 @@ class ArtistsModel(GObject.Object):
 
         :param artist: `Artist` to be removed from the model.
         '''
+        if artist.name not in self._iters:
+            return
+
         self._artists.remove(artist)
         self._tree_store.remove(self._iters[artist.name]['iter'])
 
+        # disconnect signals
+        for sig_id in self._iters[artist.name]['ids']:
+            artist.disconnect(sig_id)
+
         del self._iters[artist.name]
 
+    def get_artist_names(self):
+        '''
+        Returns the names of all the artists with albums on the albums model.
+        '''
+        return list(self._artist_albums)
+
     def contains(self, artist_name):
         '''
         Indicates if the model contains a specific artist.
@@ -500,63 +641,76 @@ class ArtistsModel(GObject.Object):
             self._tree_store.set_value(artist_iter, self.columns['show'], show)
 
 
-    def sort(self):
-
-        albums = SortedCollection(key=lambda album: getattr(album, 'name'))
-
+    def _load_sortkey(self):
+        '''
+        Reads the album sorting from the settings. Returns `True` if it
+        changed since the last time it was read.
+        '''
         gs = GSetting()
         source_settings = gs.get_setting(gs.Path.PLUGIN)
         key = source_settings[gs.PluginKey.SORT_BY_ARTIST]
         order = source_settings[gs.PluginKey.SORT_ORDER_ARTIST]
 
-        sort_keys = {
-            'name_artist': ('album_sort', 'album_sort'),
-            'year_artist': ('real_year', 'calc_year_sort'),
-            'rating_artist': ('rating', 'album_sort')
-        }
+        if key not in album_sort_keys:
+            key = 'name_artist'
 
-        props = sort_keys[key]
+        changed = key != self._sortkey['type'] or \
+                  order != self._sortkey['order']
 
-        def key_function(album):
-            keys = [getattr(album, prop) for prop in props]
-            return keys
+        self._sortkey['type'] = key
+        self._sortkey['order'] = order
+
+        return changed
+
+    def sort(self):
+        '''
+        Sorts again the albums of the expanded artists, if the album sorting
+        setting changed. Otherwise the albums are already in order, since
+        they are placed when added or modified.
+        '''
+        previous_order = self._sortkey['order']
+
+        if not self._load_sortkey():
+            return
 
         # remember the current sort then remove the sort order
-        # because sorting will only work in unsorted lists
+        # because the sorted store doesn't follow the rows reordering
         sortSettings = self.store.get_sort_column_id()
 
         self.store.set_sort_column_id(-1, Gtk.SortType.ASCENDING)
 
-        for artist in self._iters:
-            albums.clear()
-            albums.key = key_function
-
-            if 'album' in self._iters[artist] and len(self._iters[artist]['album']) > 1:
-                # we only need to sort an artists albums if there is more than one album
+        for artist in self._iters.values():
+            if 'albums' not in artist:
+                # the artist was never expanded
+                continue
 
-                # sort all the artists albums
-                for album_iter in self._iters[artist]['album']:
-                    albums.insert(self._tree_store[album_iter][self.columns['artist_album']])
+            artist_albums = artist['albums']
 
-                if not order:
-                    albums = reversed(albums)
+            # the rows of the artist follow the previous order of its albums,
+            # remember it to calculate the permutation to the new order
+            positions = dict((album, pos) for pos, album in enumerate(
+                self._albums_in_order(artist_albums, previous_order)))
 
-                # now we iterate through the sorted artist albums.  Look and swap iters
-                # according to where they are in the tree store
+            artist_albums = SortedCollection(artist_albums,
+                                             key=self._album_key)
+            artist['albums'] = artist_albums
 
-                artist_iter = self._iters[artist]['iter']
-                next_iter = self._tree_store.iter_children(artist_iter)
-
-                for album in albums:
-                    if self._tree_store[next_iter][self.columns['artist_album']] != album:
-                        self._tree_store.swap(next_iter, self._albumiters[album]['iter'])
-                        next_iter = self._albumiters[album]['iter']
-                    next_iter = self._tree_store.iter_next(next_iter)
+            if len(artist_albums) > 1:
+                new_order = [positions[album] for album in
+                             self._albums_in_order(artist_albums,
+                                                   self._sortkey['order'])]
+                self._tree_store.reorder(artist['iter'], new_order)
 
         # now we have finished sorting, reapply the sort
         if sortSettings[0]:
             self.store.set_sort_column_id(*sortSettings)
 
+    def _albums_in_order(self, artist_albums, order):
+        if order:
+            return artist_albums
+
+        return reversed(list(artist_albums))
+
 
 class ArtistCellRenderer(Gtk.CellRendererPixbuf):
     def __init__(self):
@@ -597,11 +751,10 @@ class ArtistLoader(GObject.Object):
 
     def load_artists(self):
         print("load_artists")
-        albums = self._album_manager.model.get_all()
-        model = list(set(album.artist for album in albums))
+        model = self.model.get_artist_names()
 
         self._load_artists(iter(model), artists={}, model=model,
-                           total=len(model), progress=0.)
+                           total=len(model))
 
     @idle_iterator
     def _load_artists(self):
@@ -613,9 +766,7 @@ class ArtistLoader(GObject.Object):
 
         def after(data):
             # update the progress
-            data['progress'] += ARTIST_LOAD_CHUNK
-
-            self._album_manager.progress = data['progress'] / data['total']
+            self._album_manager.progress = data['processed'] / data['total']
 
         def error(exception):
             print('Error processing entries: ' + str(exception))
@@ -633,10 +784,8 @@ class ArtistLoader(GObject.Object):
             self._artist_manager.model.add(artist)
 
         def after(data):
-            data['progress'] += ARTIST_LOAD_CHUNK
-
             # update the progress
-            self._album_manager.progress = 1 - data['progress'] / data['total']
+            self._album_manager.progress = 1 - data['processed'] / data['total']
 
         def error(exception):
             dumpstack("Something awful happened!")
@@ -657,19 +806,15 @@ class ArtistLoader(GObject.Object):
         pass
 
     def do_artists_load_finished(self, artists):
-        self._load_model(iter(list(artists.values())), total=len(artists), progress=0.)
+        self._load_model(iter(list(artists.values())), total=len(artists))
         self._album_manager.model.connect('album-added', self._on_album_added)
 
     def _on_album_added(self, album_model, album):
         '''
           called when album-manager album-added signal is invoked
         '''
-        print(album.artist)
-        if self._artist_manager.model.contains(album.artist):
-            print("contains artist")
-            artist = self._artist_manager.model.get(album.artist)
-            self._artist_manager.model.add_album_to_artist(artist, [album])
-        else:
+        # the model itself adds the album to an existing artist
+        if not self._artist_manager.model.contains(album.artist):
             print("new artist")
             artist = Artist(album.artist, self._artist_manager.cover_man.unknown_cover)
             self._artist_manager.model.add(artist)
@@ -677,9 +822,10 @@ class ArtistLoader(GObject.Object):
 
 class ArtistCoverManager(CoverManager):
     force_lastfm_check = True
+    cover_db_name = 'artist-art'
 
     def __init__(self, plugin, artist_manager):
-        self.cover_db = CoverArtExtDB(name='artist-art')
+        self.cover_db = CoverArtExtDB(name=self.cover_db_name)
 
         super(ArtistCoverManager, self).__init__(plugin, artist_manager)
 
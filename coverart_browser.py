@@ -115,6 +115,18 @@ class CoverArtBrowserPlugin(GObject.Object, Peas.Activatable):
         free all the resources used by the plugin.
         '''
         print("CoverArtBrowser DEBUG - do_deactivate")
+        album_manager = getattr(self.source, 'album_manager', None)
+
+        if album_manager:
+            # keep the albums for a faster startup next time
+            album_manager.loader.save_catalog(now=True)
+
+            # stop decoding covers
+            album_manager.cover_man.shutdown()
+
+            if album_manager.has_artist_man:
+                album_manager.artist_man.cover_man.shutdown()
+
         self.source.delete_thyself()
         if self._externalmenu:
             self._externalmenu.cleanup()
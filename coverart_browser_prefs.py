@@ -143,6 +143,9 @@ class GSetting:
                 COVER_SIZE='cover-size',
                 ADD_SHADOW='add-shadow',
                 SHADOW_IMAGE='shadow-image',
+                COVER_WORKERS='cover-workers',
+                COVER_MEMORY='cover-memory',
+                COVER_STORAGE_SIZE='cover-storage-size',
                 PANED_POSITION='paned-position',
                 SORT_BY='sort-by',
                 SORT_ORDER='sort-order',
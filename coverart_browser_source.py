@@ -962,19 +962,23 @@ class CoverArtBrowserSource(RB.Source):
 
         print("CoverArtBrowser DEBUG - export_embed_menu_item_callback()")
 
-    def update_request_status_bar(self, coverobject):
+    def update_request_status_bar(self, coverobject, done=0, total=0):
         '''
         Callback called by the album loader starts performing a new cover
         request. It prompts the source to change the content of the request
-        statusbar.
+        statusbar, showing how many of the requested covers were processed.
         '''
         print("CoverArtBrowser DEBUG - update_request_status_bar")
 
         if coverobject:
             # for example "Requesting the picture cover for the music artist Michael Jackson"
-            tranlation_string = _('Requesting cover for %s...')
+            text = _('Requesting cover for %s...') % (coverobject.name)
+
+            if total:
+                text += ' (%d/%d)' % (done, total)
+
             self.request_statusbar.set_text(
-                rb3compat.unicodedecode(_('Requesting cover for %s...') % (coverobject.name), 'UTF-8'))
+                rb3compat.unicodedecode(text, 'UTF-8'))
         else:
             self.request_status_box.hide()
             self.popup_menu.set_sensitive('cover_search_menu_item', True)
@@ -18,6 +18,8 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301  USA.
 
 import gettext
+import itertools
+import collections
 
 from gi.repository import Gdk
 from gi.repository import Gtk
@@ -27,6 +29,7 @@ from gi.repository import Gio
 from gi.repository import Pango
 from gi.repository import PangoCairo
 from gi.repository import GdkPixbuf
+import cairo
 
 from coverart_widgets import EnhancedIconView
 from coverart_browser_prefs import GSetting
@@ -34,32 +37,156 @@ from coverart_browser_prefs import CoverLocale
 from coverart_album import AlbumsModel
 from coverart_widgets import AbstractView
 from coverart_widgets import PanedCollapsible
+from coverart_utils import create_pixbuf_from_file_at_size
 import rb
 
 
 PLAY_SIZE_X = 30
 PLAY_SIZE_Y = 30
 
+# the shadow images are SHADOW_SIZE pixels wide, with a border of SHADOW_WIDTH
+# pixels around the cover
+SHADOW_SIZE = 120.
+SHADOW_WIDTH = 11
+
+# bytes the scaled covers kept ready for painting may use
+RENDER_CACHE_BUDGET = 32 * 1024 * 1024
+
 
 class CellRendererThumb(Gtk.CellRendererPixbuf):
+    '''
+    Renders an album's cover with its shadow and the text over it. The covers
+    are kept scaled on surfaces like the view's and the texts already laid
+    out, so repainting a cell is just a copy of them.
+    '''
     markup = GObject.property(type=str, default="")
+    album = GObject.property(type=object, default=None)
 
     def __init__(self, font_description, cell_area_source):
         super(CellRendererThumb, self).__init__()
         self.font_description = font_description
         self.cell_area_source = cell_area_source
 
+        # album -> (key, surface, bytes), the least recently used first
+        self._surfaces = collections.OrderedDict()
+        self._surfaces_bytes = 0
+        # album -> (key, layout, height)
+        self._layouts = {}
+
+    def invalidate(self, album=None):
+        '''
+        Forgets what was cached to paint an album, or every album if none is
+        given.
+        '''
+        if album is None:
+            self._surfaces.clear()
+            self._surfaces_bytes = 0
+            self._layouts.clear()
+        else:
+            if album in self._surfaces:
+                self._surfaces_bytes -= self._surfaces.pop(album)[2]
+
+            self._layouts.pop(album, None)
+
+    def _get_cover_surface(self, cr, width, height):
+        album = self.props.album
+        pixbuf = self.props.pixbuf
+        key = (pixbuf, width, height)
+
+        cached = self._surfaces.get(album)
+
+        if cached and cached[0] == key:
+            self._surfaces.move_to_end(album)
+            return cached[1]
+
+        # scale the cover once, on a surface like the target's
+        surface = cr.get_target().create_similar(cairo.CONTENT_COLOR_ALPHA,
+                                                 width, height)
+        context = cairo.Context(surface)
+        Gdk.cairo_set_source_pixbuf(
+            context,
+            pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR),
+            0, 0)
+        context.paint()
+
+        if album is not None:
+            if cached:
+                self._surfaces_bytes -= self._surfaces.pop(album)[2]
+
+            size = width * height * 4
+            self._surfaces[album] = (key, surface, size)
+            self._surfaces_bytes += size
+
+            # forget the least recently painted albums
+            while self._surfaces_bytes > RENDER_CACHE_BUDGET and \
+                            len(self._surfaces) > 1:
+                evicted, (key, surface_evicted, size) = \
+                    self._surfaces.popitem(last=False)
+                self._surfaces_bytes -= size
+                self._layouts.pop(evicted, None)
+
+        return surface
+
+    def _get_layout(self, cr, layout_width, rect_height):
+        album = self.props.album
+        alignment = self.cell_area_source.text_alignment
+        key = (self.markup, layout_width, rect_height, alignment)
+
+        cached = self._layouts.get(album)
+
+        if cached and cached[0] == key:
+            key, pango_layout, he = cached
+
+            # the layout was created for another context
+            PangoCairo.update_layout(cr, pango_layout)
+
+            return pango_layout, he
+
+        pango_layout = PangoCairo.create_layout(cr)
+        pango_layout.set_markup(self.markup, -1)
+        pango_layout.set_alignment(alignment)
+        pango_layout.set_font_description(self.font_description)
+        pango_layout.set_width(int(layout_width * Pango.SCALE))
+        pango_layout.set_wrap(Pango.WrapMode.WORD_CHAR)
+        wi, he = pango_layout.get_pixel_size()
+
+        if he > rect_height:
+            pango_layout.set_ellipsize(Pango.EllipsizeMode.END)
+            pango_layout.set_height(int(rect_height * Pango.SCALE))
+            wi, he = pango_layout.get_pixel_size()
+
+        if album is not None:
+            self._layouts[album] = (key, pango_layout, he)
+
+        return pango_layout, he
+
     def do_render(self, cr, widget,
                   background_area,
                   cell_area,
                   flags):
 
-        x_offset = cell_area.x + 1
-        y_offset = cell_area.y + 1
+        cell_x_offset = x_offset = cell_area.x + 1
+        cell_y_offset = y_offset = cell_area.y + 1
+        width = cell_area.width - 2
+        height = cell_area.height - 2
+
+        if self.cell_area_source.add_shadow:
+            # paint the shadow and leave room for it around the cover
+            shadow = self.cell_area_source.get_shadow_surface(width)
+
+            if shadow:
+                cr.set_source_surface(shadow, x_offset, y_offset)
+                cr.paint()
+
+                border = self.cell_area_source.get_shadow_border(width)
+                x_offset += border
+                y_offset += border
+                width -= border * 2
+                height -= border * 2
+
         # first paint the cover
-        pixbuf = self.props.pixbuf.scale_simple(cell_area.width - 2, cell_area.height - 2,
-                                                GdkPixbuf.InterpType.NEAREST)
-        Gdk.cairo_set_source_pixbuf(cr, pixbuf, x_offset, y_offset)
+        cr.set_source_surface(self._get_cover_surface(cr, width, height),
+                              x_offset, y_offset)
         cr.paint()
 
         alpha = 0.40
@@ -71,7 +198,8 @@ class CellRendererThumb(Gtk.CellRendererPixbuf):
             if self.cell_area_source.hover_pixbuf:
                 # if a hover pixbuf is given then paint this as well either just above the cover album info
                 # of at the bottom of the cell area if album info is not within the cover area
-                full, calc_x_offset, calc_y_offset = self.cell_area_source.calc_play_icon_offset(x_offset, y_offset)
+                full, calc_x_offset, calc_y_offset = self.cell_area_source.calc_play_icon_offset(cell_x_offset,
+                                                                                                  cell_y_offset)
 
                 Gdk.cairo_set_source_pixbuf(cr,
                                             self.cell_area_source.hover_pixbuf,
@@ -84,39 +212,27 @@ class CellRendererThumb(Gtk.CellRendererPixbuf):
 
         # the rest of the routine paints the contents of text within a cover if specified
 
-        # PANGO LAYOUT
-        layout_width = cell_area.width - 2
-        pango_layout = PangoCairo.create_layout(cr)
-        pango_layout.set_markup(self.markup, -1)
-        pango_layout.set_alignment(self.cell_area_source.text_alignment)
-        pango_layout.set_font_description(self.font_description)
-        pango_layout.set_width(int(layout_width * Pango.SCALE))
-        pango_layout.set_wrap(Pango.WrapMode.WORD_CHAR)
-        wi, he = pango_layout.get_pixel_size()
-
-        rect_offset = y_offset + (int((2.0 * self.cell_area_source.cover_size) / 3.0))
-        rect_height = int(self.cell_area_source.cover_size / 3.0)
+        # the text band covers the bottom third of the cover, which is
+        # smaller than the cell if there's a shadow
+        rect_offset = y_offset + (int((2.0 * height) / 3.0))
+        rect_height = int(height / 3.0)
 
-        if he > rect_height:
-            pango_layout.set_ellipsize(Pango.EllipsizeMode.END)
-            pango_layout.set_height(int((self.cell_area_source.cover_size / 3.0) * Pango.SCALE))
-            wi, he = pango_layout.get_pixel_size()
+        # PANGO LAYOUT
+        pango_layout, he = self._get_layout(cr, width, rect_height)
 
         # RECTANGLE
         cr.set_source_rgba(0.0, 0.0, 0.0, alpha)
         cr.set_line_width(0)
         cr.rectangle(x_offset,
                      rect_offset,
-                     cell_area.width - 1,
+                     width,
                      rect_height - 1)
         cr.fill()
 
         # DRAW FONT
         cr.set_source_rgba(1.0, 1.0, 1.0, 1.0)
         cr.move_to(x_offset,
-                   y_offset
-                   + 2.0 * self.cell_area_source.cover_size / 3.0
-                   + (((self.cell_area_source.cover_size / 3.0) - he) / 2.0)
+                   rect_offset + ((rect_height - he) / 2.0)
         )
         PangoCairo.show_layout(cr, pango_layout)
 
@@ -128,12 +244,18 @@ class AlbumArtCellArea(Gtk.CellAreaBox):
     display_text_pos = GObject.property(type=bool, default=False)
     display_text = GObject.property(type=bool, default=False)
     add_shadow = GObject.property(type=bool, default=False)
+    shadow_image = GObject.property(type=str, default="above")
     hover_pixbuf = GObject.property(type=object, default=None)
     text_alignment = GObject.property(type=int, default=1)
 
     def __init__(self, ):
         super(AlbumArtCellArea, self).__init__()
 
+        # the plugin is needed to find the shadow images
+        self.plugin = None
+        # size -> cairo surface with the shadow, shared by all the cells
+        self._shadow_surfaces = {}
+
         self.font_description = Pango.FontDescription.new()
         self.font_description.set_family(self.font_family)
         self.font_description.set_size(int(self.font_size * Pango.SCALE))
@@ -142,10 +264,12 @@ class AlbumArtCellArea(Gtk.CellAreaBox):
 
         # Add own cellrenderer
         renderer_thumb = CellRendererThumb(self.font_description, self)
+        self._renderer_thumb = renderer_thumb
 
         self.pack_start(renderer_thumb, False, False, False)
         self.attribute_connect(renderer_thumb, "pixbuf", AlbumsModel.columns['pixbuf'])
         self.attribute_connect(renderer_thumb, "markup", AlbumsModel.columns['markup'])
+        self.attribute_connect(renderer_thumb, "album", AlbumsModel.columns['album'])
         self.props.spacing = 2
 
     def _connect_properties(self):
@@ -164,9 +288,52 @@ class AlbumArtCellArea(Gtk.CellAreaBox):
         setting.bind(gs.PluginKey.ADD_SHADOW, self, 'add-shadow',
                      Gio.SettingsBindFlags.GET)
 
+        setting.bind(gs.PluginKey.SHADOW_IMAGE, self, 'shadow-image',
+                     Gio.SettingsBindFlags.GET)
+
         setting.bind(gs.PluginKey.TEXT_ALIGNMENT, self, 'text-alignment',
                      Gio.SettingsBindFlags.GET)
 
+        self.connect('notify::shadow-image', self._on_shadow_image_changed)
+
+    def _on_shadow_image_changed(self, *args):
+        self._shadow_surfaces = {}
+
+    def invalidate_render_cache(self, album=None):
+        '''
+        Forgets what was cached to paint an album, or every album if none is
+        given.
+        '''
+        self._renderer_thumb.invalidate(album)
+
+    def get_shadow_surface(self, size):
+        '''
+        Returns a cairo surface with the shadow to paint behind the covers,
+        at the given size. It's created only once for each size.
+
+        :param size: `int` size in pixels of the side of the shadow.
+        '''
+        surface = self._shadow_surfaces.get(size)
+
+        if not surface and self.plugin:
+            pixbuf = create_pixbuf_from_file_at_size(
+                rb.find_plugin_file(self.plugin,
+                                    'img/album-shadow-%s.png' %
+                                    self.shadow_image),
+                size, size)
+
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                         pixbuf.get_width(),
+                                         pixbuf.get_height())
+            context = cairo.Context(surface)
+            Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
+            context.paint()
+
+            # only the current size is needed after a resize
+            self._shadow_surfaces = {size: surface}
+
+        return surface
+
 
     def calc_play_icon_offset(self, initial_x_offset, initial_y_offset):
         '''
@@ -175,20 +342,33 @@ class AlbumArtCellArea(Gtk.CellAreaBox):
         :param initial_y_offset: current y_offset
         :return: bool, x & y offset where bool is the full cover position
         '''
+        # the cover is drawn inside the shadow's border
+        border = self.get_shadow_border(self.cover_size)
+        cover_size = self.cover_size - border * 2
+        x_offset = initial_x_offset + border
+        initial_y_offset += border
+
         full_cover = False
         if not (self.display_text and self.display_text_pos == False):
-            y_offset = initial_y_offset + self.cover_size - 10
+            y_offset = initial_y_offset + cover_size - 10
             full_cover = True
         else:
-            y_offset = initial_y_offset + (int((2.0 * self.cover_size) / 3.0))
-
-        x_offset = initial_x_offset
-        if self.add_shadow:
-            x_offset = initial_x_offset + 10
-            y_offset = y_offset - 10
+            y_offset = initial_y_offset + (int((2.0 * cover_size) / 3.0))
 
         return full_cover, x_offset, y_offset
 
+    def get_shadow_border(self, size):
+        '''
+        Returns the width of the shadow's border around a cover, for a cell
+        of the given size.
+
+        :param size: `int` size in pixels of the side of the cell.
+        '''
+        if not self.add_shadow:
+            return 0
+
+        return int(size / SHADOW_SIZE * SHADOW_WIDTH)
+
 
 class AlbumShowingPolicy(GObject.Object):
     '''
@@ -202,6 +382,8 @@ class AlbumShowingPolicy(GObject.Object):
         self._cover_view = cover_view  # this will need to be reworked for all views
         self._visible_paths = None
         self._has_initialised = False
+        self._last_scroll_value = 0
+        self._scrolling_down = True
 
     def initialise(self, album_manager):
         if self._has_initialised:
@@ -217,12 +399,22 @@ class AlbumShowingPolicy(GObject.Object):
                                                    self._viewport_changed)
         self._model.connect('album-updated', self._album_updated)
         self._model.connect('visual-updated', self._album_updated)
+        self._model.connect('filter-changed', self._filter_changed)
+
+    def _filter_changed(self, *args):
+        # wait for the view to show the new rows
+        GLib.idle_add(self._viewport_changed)
 
     def _viewport_changed(self, *args):
+        value = self._cover_view.props.vadjustment.get_value()
+        self._scrolling_down = value >= self._last_scroll_value
+        self._last_scroll_value = value
+
         visible_range = self._cover_view.get_visible_range()
 
         if visible_range:
             init, end = visible_range
+            self._show_covers(init, end)
 
             # i have to use the tree iter instead of the path to iterate since
             # for some reason path.next doesn't work with the filtermodel
@@ -238,6 +430,29 @@ class AlbumShowingPolicy(GObject.Object):
 
             self._visible_paths.append(end)
 
+    def _show_covers(self, init, end):
+        '''
+        Tells the cover manager which covers are shown: the ones on the
+        viewport and then the ones that are a page away in the scroll
+        direction. Those are loaded first and kept in memory.
+        '''
+        first = init.get_indices()[0]
+        last = end.get_indices()[0]
+        margin = last - first + 1
+
+        if self._scrolling_down:
+            prefetch = range(last + 1, last + 1 + margin)
+        else:
+            prefetch = range(first - 1, first - 1 - margin, -1)
+
+        store = self._model.store
+        rows = len(store)
+        albums = [self._model.get_from_path(Gtk.TreePath.new_from_indices([i]))
+                  for i in itertools.chain(range(first, last + 1), prefetch)
+                  if 0 <= i < rows]
+
+        self._album_manager.cover_man.show_covers(albums)
+
     def _album_updated(self, model, album_path, album_iter):
         # get the currently showing paths
         if not self._visible_paths:
@@ -276,6 +491,7 @@ class CoverIconView(EnhancedIconView, AbstractView):
         self._has_initialised = False
         self._last_path = None
         self._calc_motion_step = 0
+        self._batch_selection = []
         self.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
         self.object_column = AlbumsModel.columns['album']
 
@@ -288,6 +504,8 @@ class CoverIconView(EnhancedIconView, AbstractView):
         self.view_name = "covers_view"
         super(CoverIconView, self).initialise(source)
 
+        self.props.cell_area.plugin = self.plugin
+
         self.shell = source.shell
         self.album_manager = source.album_manager
 
@@ -383,7 +601,16 @@ class CoverIconView(EnhancedIconView, AbstractView):
                      self._activate_markup)
         self.connect('notify::text-alignment',
                      self._create_and_configure_renderer)
+        # the shadow is drawn with the covers, so a redraw is enough
+        self.props.cell_area.connect('notify::add-shadow',
+                                     lambda *args: self.queue_draw())
+        self.props.cell_area.connect('notify::shadow-image',
+                                     lambda *args: self.queue_draw())
         self.connect("motion-notify-event", self.on_pointer_motion)
+        self.album_manager.model.connect('visibility-batch',
+                                         self.on_visibility_batch)
+        self.album_manager.model.connect('visual-updated',
+                                         self.on_visual_updated)
 
         self.add_events(Gdk.EventMask.SCROLL_MASK)
         self.connect("scroll-event", self.on_scroll_event)
@@ -391,6 +618,34 @@ class CoverIconView(EnhancedIconView, AbstractView):
     def get_view_icon_name(self):
         return "iconview.png"
 
+    def on_visual_updated(self, model, tree_path, tree_iter):
+        '''
+        Callback called when the cover or the text of an album changes, so
+        they are painted again from scratch.
+        '''
+        self.props.cell_area.invalidate_render_cache(
+            model.get_from_path(tree_path))
+
+    def on_visibility_batch(self, model, started):
+        '''
+        Callback called when the album model starts or finishes applying a
+        big amount of visibility changes. The view is detached from the model
+        meanwhile, so it only has to layout the items once.
+        '''
+        if started:
+            self._batch_selection = self.get_selected_objects()
+            self.set_model(None)
+        else:
+            self.set_model(model.store)
+
+            for album in self._batch_selection:
+                path = model.get_path(album)
+
+                if path:
+                    self.select_path(path)
+
+            self._batch_selection = []
+
     def resize_icon(self, cover_size):
         '''
         Callback called when to resize the icon
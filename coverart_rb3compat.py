@@ -77,9 +77,13 @@ else:
 
 if PYVER >= 3:
     import http.client
+
+    HTTPException = http.client.HTTPException
 else:
     import httplib
 
+    HTTPException = httplib.HTTPException
+
 
 def responses():
     if PYVER >= 3:
@@ -123,8 +127,11 @@ def url2pathname(url):
         return urllib.url2pathname(url)
 
 
-def urlopen(filename):
+def urlopen(filename, timeout=None):
     if PYVER >= 3:
+        if timeout:
+            return urllib.request.urlopen(filename, timeout=timeout)
+
         return urllib.request.urlopen(filename)
     else:
         return urllib.urlopen(filename)
@@ -16,9 +16,14 @@
 
 from bisect import bisect_left, bisect_right
 import collections
+import heapq
 import re
 import logging
 import sys
+import time
+import os
+import threading
+import hashlib
 from collections import namedtuple
 
 from gi.repository import GdkPixbuf
@@ -93,6 +98,41 @@ def uniquify_and_sort(iterable):
     return sorted(uniques)
 
 
+NATURAL_SPLIT = re.compile('([0-9]+)')
+
+# digit runs are padded to this width on the collation keys
+COLLATION_DIGITS = 10
+
+
+def natural_sort_key(string):
+    '''
+    Returns a compact key that can be used to naturally compare strings,
+    i.e. natural_sort_key("15 album") < natural_sort_key("100 album").
+    The key is a plain tuple, so comparisons between keys run without calling
+    back into python.
+
+    >>> natural_sort_key('Disc 10 of 12')
+    ('disc ', 10, ' of ', 12, '')
+    '''
+    # re.split places the digit runs on the odd positions
+    return tuple(int(chunk) if i % 2 else chunk.lower()
+                 for i, chunk in enumerate(NATURAL_SPLIT.split(string or '')))
+
+
+def collation_key(string):
+    '''
+    Returns a folded string that naturally sorts through a plain string
+    comparison, i.e. collation_key("15 album") < collation_key("100 album").
+    Unlike `natural_sort_key`, the key can be stored on a str column of a
+    `Gtk.TreeModel`.
+
+    >>> collation_key('Disc 10 of 12')
+    'disc 0000000010 of 0000000012'
+    '''
+    return NATURAL_SPLIT.sub(lambda digits: digits.group().zfill(
+        COLLATION_DIGITS), RB.search_fold(string or ''))
+
+
 GenreType = namedtuple("GenreType", ["name", "genre_type"])
 
 
@@ -301,11 +341,24 @@ class SortedCollection(object):
             self.insert(item)
 
     def remove(self, item):
-        'Remove first occurence of item.  Raise ValueError if not found'
-        i = self.index(item)
+        '''Remove first occurence of item.  If the item's key changed since
+        it was inserted, the item itself is looked for.  Raise ValueError if
+        not found'''
+        try:
+            i = self.index(item)
+        except ValueError:
+            i = self._identity_index(item)
+
         del self._keys[i]
         del self._items[i]
 
+    def _identity_index(self, item):
+        for i, other in enumerate(self._items):
+            if other is item:
+                return i
+
+        raise ValueError('item not in collection')
+
 
 class ReversedSortedCollection(object):
     def __init__(self, sorted_collection):
@@ -362,19 +415,223 @@ class ReversedSortedCollection(object):
         return len(self) - self._sorted_collection.index(item) - 1
 
 
+class Bitset(object):
+    '''
+    Compact set of non negative integers, stored as the bits of a bytearray.
+    It grows as needed when an integer out of its current range is added.
+
+    >>> bits = Bitset()
+    >>> bits.add(3); bits.add(12)
+    >>> list(bits)
+    [3, 12]
+    >>> other = bits.copy()
+    >>> other.discard(3); other.add(5)
+    >>> bits.symmetric_difference(other)
+    [3, 5]
+    '''
+
+    def __init__(self, size=0):
+        self._bits = bytearray((size + 7) >> 3)
+
+    def copy(self):
+        bitset = self.__class__()
+        bitset._bits = bytearray(self._bits)
+
+        return bitset
+
+    def __contains__(self, index):
+        byte = index >> 3
+
+        return byte < len(self._bits) and \
+               bool(self._bits[byte] & (1 << (index & 7)))
+
+    def __iter__(self):
+        return iter(self._indexes(self._bits))
+
+    def add(self, index):
+        byte = index >> 3
+
+        if byte >= len(self._bits):
+            self._bits.extend(bytearray(byte - len(self._bits) + 1))
+
+        self._bits[byte] |= 1 << (index & 7)
+
+    def discard(self, index):
+        byte = index >> 3
+
+        if byte < len(self._bits):
+            self._bits[byte] &= ~(1 << (index & 7)) & 0xff
+
+    def symmetric_difference(self, other):
+        '''
+        Returns a sorted list with the integers contained in only one of the
+        two bitsets.
+        '''
+        size = max(len(self._bits), len(other._bits))
+        first = self._bits + bytearray(size - len(self._bits))
+        second = other._bits + bytearray(size - len(other._bits))
+
+        return self._indexes(bytearray(a ^ b for a, b in zip(first, second)))
+
+    @staticmethod
+    def _indexes(bits):
+        indexes = []
+
+        for byte, value in enumerate(bits):
+            if value:
+                base = byte << 3
+
+                for bit in range(8):
+                    if value & (1 << bit):
+                        indexes.append(base + bit)
+
+        return indexes
+
+
+class RequestQueue(object):
+    '''
+    Queue of unique items, served in the order they were pushed unless some
+    of them are bumped to the front. Checking, pushing and cancelling items
+    doesn't need to go through the queue: it's a heap of entries plus a dict
+    from each item to its entry, and cancelled entries are skipped when
+    they reach the top of the heap.
+
+    >>> queue = RequestQueue()
+    >>> queue.extend(['a', 'b', 'c', 'd'])
+    >>> queue.push('a'); queue.discard('c'); queue.bump('d')
+    >>> 'c' in queue, len(queue)
+    (False, 3)
+    >>> [queue.pop() for i in range(len(queue))]
+    ['d', 'a', 'b']
+    '''
+    # placeholder for the cancelled items
+    REMOVED = object()
+
+    def __init__(self):
+        self._heap = []
+        # item -> [priority, item]; priorities are never repeated, so the
+        # items themselves are never compared
+        self._entries = {}
+        self._last = 0
+        self._first = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, item):
+        return item in self._entries
+
+    def push(self, item):
+        '''
+        Adds an item at the end of the queue, unless it's already queued.
+        '''
+        if item not in self._entries:
+            self._last += 1
+            self._add(item, self._last)
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def bump(self, item):
+        '''
+        Moves an item to the front of the queue, adding it if it wasn't
+        queued.
+        '''
+        self.discard(item)
+
+        self._first -= 1
+        self._add(item, self._first)
+
+    def _add(self, item, priority):
+        entry = [priority, item]
+        self._entries[item] = entry
+        heapq.heappush(self._heap, entry)
+
+    def discard(self, item):
+        '''
+        Removes an item from the queue, if it's there.
+        '''
+        entry = self._entries.pop(item, None)
+
+        if entry:
+            # mark the entry so it's skipped
+            entry[-1] = self.REMOVED
+
+    def pop(self):
+        '''
+        Removes and returns the item at the front of the queue. Raises
+        `IndexError` if the queue is empty.
+        '''
+        while self._heap:
+            priority, item = heapq.heappop(self._heap)
+
+            if item is not self.REMOVED:
+                del self._entries[item]
+                return item
+
+        raise IndexError('pop from an empty queue')
+
+    def peek(self):
+        '''
+        Returns the item at the front of the queue without removing it. Raises
+        `IndexError` if the queue is empty.
+        '''
+        while self._heap:
+            if self._heap[0][-1] is not self.REMOVED:
+                return self._heap[0][-1]
+
+            heapq.heappop(self._heap)
+
+        raise IndexError('peek from an empty queue')
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+
+
+# time (in seconds) an idle iterator may use on each idle call before giving
+# the control back to the main loop
+IDLE_TIME_BUDGET = 0.008
+
+# weight of the last measure when estimating the cost of processing an item
+IDLE_COST_SMOOTHING = 0.3
+
+
 class IdleCallIterator(object):
-    def __init__(self, chunk, process, after=None, error=None, finish=None):
+    '''
+    Processes the elements of an iterator on successive idle calls.
+
+    When a time budget is given, each call processes elements until the
+    budget is used, and the chunk is adapted to the measured cost per
+    element. Otherwise, every call processes a fixed chunk of elements.
+    The number of elements processed so far is kept on data['processed'], and
+    some statistics of the job are available on the `stats` attribute.
+
+    :param chunk: `int` number of elements to process on each call (the
+        initial estimation when there's a time budget).
+    :param budget: `float` seconds each call may take, or None to process
+        fixed chunks.
+    '''
+
+    def __init__(self, chunk, process, after=None, error=None, finish=None,
+                 budget=IDLE_TIME_BUDGET):
         default = lambda *_: None
 
         self._chunk = chunk
+        self._budget = budget
         self._process = process
         self._after = after if after else default
         self._error = error if error else default
         self._finish = finish if finish else default
         self._stop = False
 
+        self.stats = {'calls': 0, 'processed': 0, 'elapsed': 0.,
+                      'item_cost': None, 'chunk': chunk}
+
     def __call__(self, iterator, **data):
         self._iter = iterator
+        data['processed'] = 0
 
         Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self._idle_call, data)
 
@@ -382,21 +639,61 @@ class IdleCallIterator(object):
         if self._stop:
             return False
 
+        start = time.perf_counter()
+        deadline = start + self._budget if self._budget else None
+        processed = 0
+        finished = False
+
         for i in range(self._chunk):
             try:
                 next_elem = next(self._iter)
 
                 self._process(next_elem, data)
             except StopIteration:
-                self._finish(data)
-                return False
+                finished = True
+                break
             except Exception as e:
                 self._error(e)
 
+            processed += 1
+
+            if deadline and time.perf_counter() > deadline:
+                break
+
+        data['processed'] += processed
+        self._update_stats(processed, time.perf_counter() - start)
+
+        if finished:
+            self._finish(data)
+            return False
+
         self._after(data)
 
         return True
 
+    def _update_stats(self, processed, elapsed):
+        stats = self.stats
+        stats['calls'] += 1
+        stats['processed'] += processed
+        stats['elapsed'] += elapsed
+
+        if not processed:
+            return
+
+        cost = elapsed / processed
+
+        if stats['item_cost'] is not None:
+            cost = IDLE_COST_SMOOTHING * cost + \
+                   (1 - IDLE_COST_SMOOTHING) * stats['item_cost']
+
+        stats['item_cost'] = cost
+
+        if self._budget:
+            # guess how many elements fit on the next call
+            self._chunk = max(1, int(self._budget / cost) if cost else
+                              self._chunk * 2)
+            stats['chunk'] = self._chunk
+
     def stop(self):
         self._stop = True
 
@@ -759,6 +1056,399 @@ def create_pixbuf_from_file_at_size(filename, width, height):
     return pixbuf
 
 
+# bytes read at once when downloading an image
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# maximum bytes of an image that is downloaded
+DOWNLOAD_MAX_BYTES = 32 * 1024 * 1024
+
+# seconds to wait for the server when downloading an image
+DOWNLOAD_TIMEOUT = 30
+
+
+def download_pixbuf(uri, max_size=0, max_bytes=DOWNLOAD_MAX_BYTES,
+                    timeout=DOWNLOAD_TIMEOUT):
+    '''
+    Downloads an image, decoding it as the data arrives instead of waiting for
+    the whole of it. The image is scaled down while it's decoded if it's
+    larger than the given size. It blocks until the download finishes, so it
+    should be called from a separate thread.
+
+    :param uri: `str` uri of the image.
+    :param max_size: `int` maximum size in pixels of the sides of the image,
+        keeping its aspect ratio, or 0 to keep its size.
+    :param max_bytes: `int` maximum bytes to download. Bigger images are
+        discarded.
+    :param timeout: `int` seconds to wait for the server.
+
+    :return: `GdkPixbuf.Pixbuf` with the image or None if it couldn't be
+        downloaded or decoded.
+    '''
+    loader = GdkPixbuf.PixbufLoader()
+
+    def size_prepared(loader, width, height):
+        scale = min(1., float(max_size) / max(width, height))
+
+        if scale < 1:
+            loader.set_size(max(1, int(width * scale)),
+                            max(1, int(height * scale)))
+
+    if max_size:
+        loader.connect('size-prepared', size_prepared)
+
+    downloaded = False
+
+    try:
+        response = rb3compat.urlopen(uri, timeout)
+
+        try:
+            length = response.headers.get('Content-Length')
+
+            if length and int(length) > max_bytes:
+                raise ValueError('the image is bigger than %d bytes' %
+                                 max_bytes)
+
+            received = 0
+
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+
+                if not chunk:
+                    break
+
+                received += len(chunk)
+
+                if received > max_bytes:
+                    raise ValueError('the image is bigger than %d bytes' %
+                                     max_bytes)
+
+                loader.write(chunk)
+        finally:
+            response.close()
+
+        downloaded = True
+    except (IOError, ValueError, GLib.Error, rb3compat.HTTPException) as e:
+        print('Error while downloading an image: ' + str(e))
+    finally:
+        # the loader is always closed, even if the download failed
+        try:
+            loader.close()
+        except GLib.Error as e:
+            if downloaded:
+                print('Error while decoding an image: ' + str(e))
+
+            downloaded = False
+
+    return loader.get_pixbuf() if downloaded else None
+
+
+def load_pixbuf(path, max_size=0):
+    '''
+    Loads an image from a file. The image is scaled down while it's decoded
+    if it's larger than the given size, but smaller images aren't enlarged.
+
+    :param path: `str` path of the image.
+    :param max_size: `int` maximum size in pixels of the sides of the image,
+        keeping its aspect ratio, or 0 to keep its size.
+
+    :return: `GdkPixbuf.Pixbuf` with the image or None if it couldn't be
+        decoded.
+    '''
+    try:
+        file_format, width, height = GdkPixbuf.Pixbuf.get_file_info(path)
+
+        if max_size and file_format and max(width, height) > max_size:
+            return GdkPixbuf.Pixbuf.new_from_file_at_scale(path, max_size,
+                                                           max_size, True)
+
+        return GdkPixbuf.Pixbuf.new_from_file(path)
+    except GLib.Error as e:
+        print('Error while loading an image: ' + str(e))
+
+        return None
+
+
+class ThumbnailCache(object):
+    '''
+    On-disk cache of scaled versions of images, keyed by the original's path,
+    its modification time and the requested size. The thumbnails are stored
+    compressed (as jpeg, or png if they have transparency), so many of them
+    fit in the cache and loading them is far cheaper than decoding the
+    original.
+    The cache is trimmed by total size and by age; using a thumbnail
+    refreshes its age. The size grows with the number of thumbnails reserved
+    by the users of the cache. It can be used from several threads at once.
+    It also keeps digests of the images' contents, so identical images can
+    be told apart from different ones without reading them each time.
+
+    :param directory: `str` path where the thumbnails are kept.
+    :param max_size: `int` maximum size in bytes of the cache.
+    :param max_age: `int` seconds a thumbnail is kept since it was last used.
+    '''
+    # storage for the default instance
+    instance = None
+
+    # changes whenever the format of the thumbnails does, so the older ones
+    # are never read and eventually trimmed
+    VERSION = 2
+    # average bytes per pixel of a compressed thumbnail, used to estimate the
+    # size needed for the reserved thumbnails
+    BYTES_PER_PIXEL = 0.5
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024,
+                 max_age=90 * 24 * 60 * 60):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self._size = None
+        self._size_lock = threading.Lock()
+        # size given on creation, the reserved size is never smaller
+        self._min_size = max_size
+        # owner -> bytes reserved for its thumbnails
+        self._reservations = {}
+
+        # (canonical path, mtime) -> digest of the contents
+        self._digests = {}
+
+    @classmethod
+    def get_default(cls):
+        '''
+        Returns the cache shared by the whole plugin.
+        '''
+        if not cls.instance:
+            cls.instance = cls(os.path.join(RB.user_cache_dir(),
+                                            'coverart_browser', 'thumbnails'))
+
+        return cls.instance
+
+    def _thumbnail_path(self, filename, width, height):
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+
+        key = '%s\0%d\0%dx%d\0%d' % (filename, mtime, width, height,
+                                   self.VERSION)
+
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def reserve(self, owner, count, width, height):
+        '''
+        Makes the cache big enough to hold a number of thumbnails of the given
+        size, so a large library doesn't keep trimming its own thumbnails.
+        The reservation replaces any previous one of the same owner.
+
+        :param owner: `str` identifying who makes the reservation.
+        :param count: `int` number of thumbnails.
+        :param width: `int` width of the thumbnails.
+        :param height: `int` height of the thumbnails.
+        '''
+        self._reservations[owner] = \
+            int(count * width * height * self.BYTES_PER_PIXEL)
+        self.max_size = max(self._min_size, sum(self._reservations.values()))
+
+    def get_digest(self, filename):
+        '''
+        Returns a digest of the contents of the image at filename, or None if
+        it can't be read. Identical images have the same digest, whatever
+        their paths.
+        '''
+        filename = os.path.realpath(filename)
+
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+
+        digest = self._digests.get((filename, mtime))
+
+        if digest:
+            return digest
+
+        key = '%s\0%d\0digest' % (filename, mtime)
+        path = os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+        try:
+            with open(path, 'rb') as digest_file:
+                digest = digest_file.read().decode('ascii')
+
+            # refresh the digest's age
+            os.utime(path)
+        except (IOError, OSError, UnicodeDecodeError):
+            digest = None
+
+        if not digest:
+            try:
+                with open(filename, 'rb') as image:
+                    digest = hashlib.sha1(image.read()).hexdigest()
+            except (IOError, OSError):
+                return None
+
+            self._write(path, [digest.encode('ascii')])
+
+        self._digests[(filename, mtime)] = digest
+
+        return digest
+
+    def get_pixbuf(self, filename, width, height):
+        '''
+        Returns a pixbuf of the image at filename scaled to the given size,
+        taking it from the cache when possible.
+        '''
+        path = self._thumbnail_path(filename, width, height)
+        pixbuf = self._load(path) if path else None
+
+        if not pixbuf:
+            pixbuf = create_pixbuf_from_file_at_size(filename, width, height)
+
+            if path:
+                self._store(path, pixbuf)
+
+        return pixbuf
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as thumbnail:
+                data = thumbnail.read()
+
+            # refresh the thumbnail's age
+            os.utime(path)
+        except (IOError, OSError):
+            return None
+
+        loader = GdkPixbuf.PixbufLoader()
+
+        try:
+            loader.write(data)
+            loader.close()
+        except GLib.Error:
+            return None
+
+        return loader.get_pixbuf()
+
+    def _store(self, path, pixbuf):
+        if pixbuf.get_has_alpha():
+            saved, data = pixbuf.save_to_bufferv('png', [], [])
+        else:
+            saved, data = pixbuf.save_to_bufferv('jpeg', ['quality'], ['90'])
+
+        if saved:
+            self._write(path, [data])
+
+    def _write(self, path, chunks):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # write to a temporary file first, so a half written file is
+            # never read
+            temp_path = '%s.%d.tmp' % (path, threading.get_ident())
+
+            with open(temp_path, 'wb') as cache_file:
+                for chunk in chunks:
+                    cache_file.write(chunk)
+
+            os.replace(temp_path, path)
+        except (IOError, OSError) as e:
+            print('Error while storing a thumbnail: ' + str(e))
+            return
+
+        with self._size_lock:
+            if self._size is None:
+                self._trim()
+            else:
+                self._size += sum(len(chunk) for chunk in chunks)
+
+                if self._size > self.max_size:
+                    self._trim()
+
+    def trim(self):
+        '''
+        Removes the thumbnails not used for longer than the maximum age and,
+        if the cache is still too big, the least recently used ones.
+        '''
+        with self._size_lock:
+            self._trim()
+
+    def _trim(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            self._size = 0
+            return
+
+        thumbnails = []
+
+        for name in names:
+            path = os.path.join(self.directory, name)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            thumbnails.append((stat.st_mtime, stat.st_size, path))
+
+        # the most recently used first
+        thumbnails.sort(reverse=True)
+
+        oldest = time.time() - self.max_age
+        # leave some room so the cache isn't trimmed on every store
+        limit = self.max_size * 0.9
+        size = 0
+
+        for mtime, file_size, path in thumbnails:
+            if mtime >= oldest and size + file_size <= limit:
+                size += file_size
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                size += file_size
+
+        self._size = size
+
+
+class RateLimiter(object):
+    '''
+    Token bucket that limits how often something is done: up to `burst`
+    times at once and `rate` times per second on average.
+
+    :param rate: `float` times per second.
+    :param burst: `int` times that may be done at once.
+    :param clock: `callable` returning the current time in seconds.
+    '''
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+
+        self._tokens = burst
+        self._last = clock()
+
+    def acquire(self):
+        '''
+        Takes a token if there is one available.
+
+        :return: `float` 0 if the token was taken or else the seconds until
+            one is available.
+        '''
+        now = self._clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+
+        return (1 - self._tokens) / self.rate
+
+
 '''
 class to search through a dict without case-sensitivity nor
 unicode vs string issues
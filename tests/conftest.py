@@ -0,0 +1,8 @@
+import gettext
+import os
+import sys
+
+# the plugin's modules are imported from the top of the tree, as Rhythmbox
+# does, and they expect gettext's _ to be installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+gettext.install('coverart_browser')
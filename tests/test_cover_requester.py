@@ -0,0 +1,106 @@
+import pytest
+
+pytest.importorskip('gi.repository.RB', reason='needs Rhythmbox')
+
+from coverart_album import CoverRequester
+from coverart_album import CoverSearchMisses
+
+
+class StandInKey(object):
+    def __init__(self, name):
+        self.name = name
+
+    def to_string(self):
+        return 'album=' + self.name
+
+
+class StandInExtDB(object):
+    '''
+    Replaces `RB.ExtDB`, answering each request right away with the covers it
+    knows about.
+    '''
+
+    def __init__(self, covers=()):
+        self.covers = set(covers)
+        self.requested = []
+
+    def request(self, key, callback, user_data):
+        self.requested.append(key.name)
+
+        filename = '/covers/' + key.name if key.name in self.covers else None
+        callback(key, key, filename, None, user_data)
+
+        return True
+
+
+class StandInAlbum(object):
+    def __init__(self, name, cover):
+        self.name = name
+        self.cover = cover
+
+    def create_ext_db_key(self):
+        return StandInKey(self.name)
+
+
+@pytest.fixture
+def misses(tmpdir):
+    return CoverSearchMisses(str(tmpdir.join('misses.json')))
+
+
+def create_requester(cover_db, misses):
+    requester = CoverRequester(cover_db, misses, concurrency=4, rate=1000)
+    requester.unknown_cover = object()
+
+    return requester
+
+
+def test_replace_queue_skips_recent_misses(misses):
+    cover_db = StandInExtDB()
+    requester = create_requester(cover_db, misses)
+    albums = [StandInAlbum(name, requester.unknown_cover)
+              for name in ('a', 'b', 'c')]
+    misses.add('album=b')
+    finished = []
+
+    requester.replace_queue(albums, lambda *args: finished.append(args))
+
+    assert cover_db.requested == ['a', 'c']
+    assert finished[-1] == (None,)
+    assert 'album=a' in misses
+    assert 'album=c' in misses
+
+
+def test_add_to_queue_searches_recent_misses_again(misses):
+    cover_db = StandInExtDB(covers=['b'])
+    requester = create_requester(cover_db, misses)
+    album = StandInAlbum('b', requester.unknown_cover)
+    misses.add('album=b')
+    finished = []
+
+    requester.add_to_queue([album], lambda *args: finished.append(args))
+
+    assert cover_db.requested == ['b']
+    assert finished[-1] == (None,)
+    assert 'album=b' not in misses
+
+
+def test_misses_are_kept_between_sessions(misses):
+    requester = create_requester(StandInExtDB(), misses)
+    albums = [StandInAlbum('a', requester.unknown_cover)]
+
+    requester.replace_queue(albums, lambda *args: None)
+
+    cover_db = StandInExtDB()
+    requester = create_requester(cover_db, CoverSearchMisses(misses.filename))
+    requester.replace_queue(albums, lambda *args: None)
+
+    assert cover_db.requested == []
+
+
+def test_albums_with_cover_are_not_searched(misses):
+    cover_db = StandInExtDB()
+    requester = create_requester(cover_db, misses)
+
+    requester.replace_queue([StandInAlbum('a', object())], lambda *args: None)
+
+    assert cover_db.requested == []
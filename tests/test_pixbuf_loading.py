@@ -0,0 +1,109 @@
+import functools
+import http.server
+import threading
+
+import pytest
+
+pytest.importorskip('gi.repository.RB', reason='needs Rhythmbox')
+
+from gi.repository import GdkPixbuf
+
+from coverart_utils import download_pixbuf
+from coverart_utils import load_pixbuf
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+    '''
+    Serves the files of a directory, plus a chunked response that is cut
+    before its end at /truncated.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path != '/truncated':
+            return super(StandInHandler, self).do_GET()
+
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.write(b'2000\r\n' + b'x' * 100)
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def save_image(path, width, height):
+    pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, width,
+                                  height)
+    pixbuf.fill(0x336699ff)
+    pixbuf.savev(path, 'png', [], [])
+
+    return path
+
+
+@pytest.fixture(scope='module')
+def images(tmpdir_factory):
+    directory = tmpdir_factory.mktemp('images')
+    save_image(str(directory.join('big.png')), 800, 400)
+    save_image(str(directory.join('small.png')), 100, 50)
+
+    return directory
+
+
+@pytest.fixture(scope='module')
+def server(images):
+    handler = functools.partial(StandInHandler, directory=str(images))
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield 'http://127.0.0.1:%d/' % httpd.server_port
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def size(pixbuf):
+    return pixbuf.get_width(), pixbuf.get_height()
+
+
+def test_download_scales_down_big_images(server):
+    assert size(download_pixbuf(server + 'big.png', 200)) == (200, 100)
+
+
+def test_download_keeps_small_images(server):
+    assert size(download_pixbuf(server + 'small.png', 200)) == (100, 50)
+
+
+def test_download_without_max_size(server):
+    assert size(download_pixbuf(server + 'big.png')) == (800, 400)
+
+
+def test_download_discards_images_over_max_bytes(server):
+    assert download_pixbuf(server + 'big.png', max_bytes=10) is None
+
+
+def test_download_of_missing_image(server):
+    assert download_pixbuf(server + 'missing.png') is None
+
+
+def test_download_of_truncated_response(server):
+    assert download_pixbuf(server + 'truncated') is None
+
+
+def test_load_scales_down_big_images(images):
+    assert size(load_pixbuf(str(images.join('big.png')), 200)) == (200, 100)
+
+
+def test_load_keeps_small_images(images):
+    assert size(load_pixbuf(str(images.join('small.png')), 200)) == (100, 50)
+
+
+def test_load_of_invalid_image(tmpdir):
+    path = tmpdir.join('invalid.png')
+    path.write('not an image')
+
+    assert load_pixbuf(str(path), 200) is None